@@ -1,18 +1,99 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, Response
-import requests
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from html import escape
+from urllib.parse import urlencode
 import json
+import os
+import time
 
-app = FastAPI()
+from log_reader import LogFilter
+from metrics import Metrics, MetricsMiddleware
+from profiler import install_profiler
+from static_pages import STATIC_ASSETS, LazyPage, three_ds_method_js
+from tracing import install_tracing
+from upstream import Upstream, UpstreamCache, conditional_headers, copy_cache_headers
 
-IDENTSERVER = "http://identserver.local:8001"
+
+@asynccontextmanager
+async def lifespan(app):
+    await tracer.start()
+    try:
+        yield
+    finally:
+        await upstream.aclose()
+        await tracer.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+IDENTSERVER = os.environ.get("IDENTSERVER", "http://identserver.local:8001")
+
+# Метрики для /metrics (см. metrics.py)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# Спаны запросов и traceparent к identserver — при TRACING_ENABLED=1 (см. tracing.py)
+tracer = install_tracing(app, "domain1")
+
+# Общий keep-alive клиент к identserver (см. upstream.py)
+upstream = Upstream(IDENTSERVER, tracer=tracer)
+
+# Семплирующий профайлер — только при PROFILER_ENABLED=1 (см. profiler.py)
+profiler = install_profiler(app)
+
+
+def record_upstream_call(caller: str, status, started: float) -> None:
+    """Учитывает обращение к identserver: кто звал, чем кончилось, сколько длилось."""
+    metrics.inc(
+        "upstream_requests_total",
+        {"caller": caller, "status": status},
+        help_text="Запросы domain1 к identserver",
+    )
+    metrics.observe(
+        "upstream_request_duration_seconds",
+        {"caller": caller},
+        time.perf_counter() - started,
+        help_text="Латентность запросов domain1 к identserver",
+    )
+
+
+# Чтения для /view-logs и /test-results: TTL-кэш, stale-while-revalidate
+# и circuit breaker (см. UpstreamCache в upstream.py)
+upstream_cache = UpstreamCache.from_env(upstream, record=record_upstream_call)
+metrics.gauge("upstream_circuit_open", lambda: int(upstream_cache.breaker.state != "closed"),
+              "1 — circuit breaker к identserver разомкнут")
+
+
+async def read_identserver(path: str, params: dict = None, caller: str = ""):
+    result = await upstream_cache.get_json(path, params, caller=caller)
+    metrics.inc(
+        "upstream_cache_total",
+        {"caller": caller, "state": result.state},
+        help_text="Ответы страниц domain1 из кэша чтений identserver по состоянию",
+    )
+    return result
+
+
+def upstream_notice(result) -> str:
+    """Плашка над таблицей, если данные не свежие."""
+    if result.state == "stale":
+        return f'<p class="notice">identserver не ответил вовремя — данные {result.age:.0f} с назад</p>'
+    if result.state == "missing":
+        return '<p class="notice">identserver недоступен — данных нет</p>'
+    return ""
+
+
+def with_upstream_state(html: str, result) -> HTMLResponse:
+    resp = HTMLResponse(html)
+    resp.headers["X-Upstream-Data"] = result.state
+    return resp
 
 
 # Главная
 
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    html = """
+def render_index() -> str:
+    return """
     <!DOCTYPE html>
     <html>
     <head>
@@ -36,19 +117,56 @@ async def index():
     </body>
     </html>
     """
-    return HTMLResponse(html)
+
+
+index_page = LazyPage(render_index)
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    return index_page.response(request)
+
+
+def device_id_script(label: str) -> str:
+    """
+    Приём DEVICE_ID от iframe. Кроме вывода на страницу:
+    window.__deviceIdReady — promise с {id, mode, channels, ms}
+    и событие "deviceid" с тем же detail. ms — performance.now()
+    в момент прихода UID, то есть время от начала навигации.
+    Стоит в <head>, чтобы слушатель был до загрузки iframe.
+    """
+    return """<script>
+        window.__deviceIdReady = new Promise(function(resolve) {
+            window.addEventListener("message", function(event) {
+                if (!event.data || event.data.type !== "DEVICE_ID") return;
+                var detail = {
+                    id: event.data.id || "",
+                    mode: event.data.mode || "",
+                    channels: event.data.channels || {},
+                    ms: Math.round(performance.now() * 100) / 100
+                };
+                document.getElementById("uid-value").textContent = detail.id || "(пусто)";
+                document.getElementById("mode-value").textContent = detail.mode;
+                document.getElementById("channels").textContent =
+                    JSON.stringify(detail.channels, null, 2);
+                console.log("%s DEVICE_ID:", event.data);
+                resolve(detail);
+                window.dispatchEvent(new CustomEvent("deviceid", { detail: detail }));
+            });
+        });
+        </script>""" % label
 
 
 # STAND A: CROSS-ORIGIN
 
-@app.get("/test-cross", response_class=HTMLResponse)
-async def test_cross():
-    html = f"""
+def render_test_cross() -> str:
+    return f"""
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="UTF-8" />
         <title>Стенд A — CROSS-ORIGIN iframe</title>
+        {device_id_script("CROSS")}
         <style>
             body {{ font-family: -apple-system,BlinkMacSystemFont,sans-serif; padding: 20px; }}
             #uid-box {{ margin-top: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 8px; }}
@@ -71,47 +189,56 @@ async def test_cross():
             <pre id="channels">{{}}</pre>
         </div>
 
-        <script>
-        window.addEventListener("message", function(event) {{
-            if (!event.data || event.data.type !== "DEVICE_ID") return;
-            document.getElementById("uid-value").textContent = event.data.id || "(пусто)";
-            document.getElementById("mode-value").textContent = event.data.mode || "";
-            document.getElementById("channels").textContent =
-                JSON.stringify(event.data.channels, null, 2);
-            console.log("CROSS DEVICE_ID:", event.data);
-        }});
-        </script>
-
         <p><a href="/">Назад</a></p>
     </body>
     </html>
     """
-    return HTMLResponse(html)
+
+
+test_cross_page = LazyPage(render_test_cross)
+
+
+@app.get("/test-cross", response_class=HTMLResponse)
+async def test_cross(request: Request):
+    return test_cross_page.response(request)
 
 
 # ---------- STAND B: SAME-ORIGIN PROXY ----------
 
 @app.get("/proxy-cache.png")
-async def proxy_cache():
+async def proxy_cache(request: Request):
     """
     Проксируем PNG с identserver, но под доменом domain1.local.
     Это имитация Same-Origin/Own CDN подхода.
+    If-None-Match браузера уходит на identserver, 304 отдаём как есть.
     """
-    r = requests.get(f"{IDENTSERVER}/cache.png", timeout=5)
-    resp = Response(content=r.content, media_type="image/png")
-    for h in ["ETag", "Cache-Control", "Expires"]:
-        if h in r.headers:
-            resp.headers[h] = r.headers[h]
+    headers = conditional_headers(request.headers)
+    headers["X-Evercookie-Mode"] = "proxy"
+    started = time.perf_counter()
+    try:
+        r = await upstream.get("/cache.png", headers=headers)
+    except Exception:
+        # Не только httpx.HTTPError: через ASGITransport (launcher.py) исключение
+        # из identserver приходит сюда как есть, а это всё равно 502, не 500
+        record_upstream_call("proxy_cache", "error", started)
+        return Response(status_code=502)
+    record_upstream_call("proxy_cache", r.status_code, started)
+
+    if r.status_code == 304:
+        resp = Response(status_code=304)
+    else:
+        resp = Response(content=r.content, status_code=r.status_code, media_type="image/png")
+    copy_cache_headers(r.headers, resp.headers)
     return resp
 
 
-@app.get("/3ds-method-proxy", response_class=HTMLResponse)
-async def three_ds_method_proxy():
+def render_three_ds_method_proxy() -> str:
     """
     3DS Method, но уже как first-party (domain1.local).
     Всё выполняется здесь, логируем на identserver.
+    Логика — общий static/3ds-method.js, PNG через proxy-cache.png.
     """
-    html = f"""
+    return f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -119,151 +246,32 @@ async def three_ds_method_proxy():
     <title>3DS Method - PROXY</title>
 </head>
 <body>
-<script>
-// --- IndexedDB helpers ---
-function idb_get(dbName, storeName, key) {{
-    return new Promise((resolve) => {{
-        const req = indexedDB.open(dbName, 1);
-        req.onupgradeneeded = () => {{
-            let db = req.result;
-            db.createObjectStore(storeName);
-        }};
-        req.onsuccess = () => {{
-            let db = req.result;
-            const tx = db.transaction(storeName, "readonly");
-            const store = tx.objectStore(storeName);
-            const r = store.get(key);
-            r.onsuccess = () => resolve(r.result || null);
-            r.onerror = () => resolve(null);
-        }};
-        req.onerror = () => resolve(null);
-    }});
-}}
-
-function idb_set(dbName, storeName, key, value) {{
-    return new Promise((resolve) => {{
-        const req = indexedDB.open(dbName, 1);
-        req.onupgradeneeded = () => {{
-            let db = req.result;
-            db.createObjectStore(storeName);
-        }};
-        req.onsuccess = () => {{
-            let db = req.result;
-            const tx = db.transaction(storeName, "readwrite");
-            const store = tx.objectStore(storeName);
-            store.put(value, key);
-            tx.oncomplete = () => resolve(true);
-            tx.onerror = () => resolve(false);
-        }};
-        req.onerror = () => resolve(false);
-    }});
-}}
-
-// --- PNG cache через proxy-cache.png ---
-class PNGCache {{
-    constructor(endpoint) {{
-        this.endpoint = endpoint;
-        this.canvasWidth = 200;
-    }}
-    loadUID() {{
-        return new Promise((resolve) => {{
-            const img = new Image();
-            img.onload = () => {{
-                const canvas = document.createElement("canvas");
-                canvas.width = this.canvasWidth;
-                canvas.height = 1;
-                const ctx = canvas.getContext("2d");
-                ctx.drawImage(img, 0, 0);
-                const pix = ctx.getImageData(0, 0, this.canvasWidth, 1).data;
-                let uid = "";
-                for (let i = 0; i < pix.length; i += 4) {{
-                    const r = pix[i], g = pix[i+1], b = pix[i+2];
-                    if (r === 0 && g === 0 && b === 0) break;
-                    uid += String.fromCharCode(r);
-                    if (g !== 0) uid += String.fromCharCode(g);
-                    if (b !== 0) uid += String.fromCharCode(b);
-                }}
-                resolve(uid || null);
-            }};
-            img.onerror = () => resolve(null);
-            img.src = "/proxy-cache.png";
-        }});
-    }}
-}}
-
-(async () => {{
-    let cookieVal = null;
-    try {{
-        const m = document.cookie.match(/device_id=([^;]+)/);
-        if (m) cookieVal = m[1];
-    }} catch(e) {{}}
-
-    let lsVal = null;
-    try {{ lsVal = localStorage.getItem("device_id"); }} catch(e){{}}
-
-    let ssVal = null;
-    try {{ ssVal = sessionStorage.getItem("device_id"); }} catch(e){{}}
-
-    let idbVal = null;
-    try {{ idbVal = await idb_get("evercookieDB","store","device_id"); }} catch(e){{}}
-
-    const png = new PNGCache("/proxy-cache.png");
-    let pngVal = null;
-    try {{ pngVal = await png.loadUID(); }} catch(e){{}}
-
-    const candidates = [cookieVal, lsVal, ssVal, idbVal, pngVal].filter(Boolean);
-    let finalUID = candidates.length > 0 ? candidates[0] : null;
-    if (!finalUID) {{
-        finalUID = pngVal || Math.random().toString(16).slice(2, 18);
-    }}
-
-    try {{ document.cookie = "device_id=" + finalUID + "; path=/; SameSite=Lax"; }} catch(e){{}}
-    try {{ localStorage.setItem("device_id", finalUID); }} catch(e){{}}
-    try {{ sessionStorage.setItem("device_id", finalUID); }} catch(e){{}}
-    try {{ await idb_set("evercookieDB","store","device_id", finalUID); }} catch(e){{}}
-
-    const channels = {{
-        cookie: cookieVal,
-        localStorage: lsVal,
-        sessionStorage: ssVal,
-        indexedDB: idbVal,
-        pngCache: pngVal
-    }};
-
-    window.parent.postMessage({{
-        type: "DEVICE_ID",
-        id: finalUID,
-        mode: "proxy",
-        channels
-    }}, "*");
-
-    fetch("{IDENTSERVER}/log", {{
-        method: "POST",
-        headers: {{ "Content-Type": "application/json" }},
-        body: JSON.stringify({{
-            uid: finalUID,
-            mode: "proxy",
-            channels,
-            userAgent: navigator.userAgent,
-            timestamp: new Date().toISOString()
-        }})
-    }}).catch(()=>{{}});
-)();
-</script>
+<script src="{three_ds_method_js.url}"
+        data-mode="proxy"
+        data-png="/proxy-cache.png"
+        data-log="{IDENTSERVER}/log"
+        data-cookie-attrs="path=/; SameSite=Lax"></script>
 </body>
 </html>
 """
-    return HTMLResponse(html)
 
 
-@app.get("/test-proxy", response_class=HTMLResponse)
-async def test_proxy():
-    html = """
+three_ds_method_proxy_page = LazyPage(render_three_ds_method_proxy)
+
+
+@app.get("/3ds-method-proxy", response_class=HTMLResponse)
+async def three_ds_method_proxy(request: Request):
+    return three_ds_method_proxy_page.response(request)
+
+
+def render_test_proxy() -> str:
+    return """
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="UTF-8" />
         <title>Стенд B — SAME-ORIGIN PROXY iframe</title>
+        """ + device_id_script("PROXY") + """
         <style>
             body { font-family: -apple-system,BlinkMacSystemFont,sans-serif; padding: 20px; }
             #uid-box { margin-top: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 8px; }
@@ -286,107 +294,279 @@ async def test_proxy():
             <pre id="channels">{{}}</pre>
         </div>
 
-        <script>
-        window.addEventListener("message", function(event) {
-            if (!event.data || event.data.type !== "DEVICE_ID") return;
-            document.getElementById("uid-value").textContent = event.data.id || "(пусто)";
-            document.getElementById("mode-value").textContent = event.data.mode || "";
-            document.getElementById("channels").textContent =
-                JSON.stringify(event.data.channels, null, 2);
-            console.log("PROXY DEVICE_ID:", event.data);
-        });
-        </script>
-
         <p><a href="/">Назад</a></p>
     </body>
     </html>
     """
-    return HTMLResponse(html)
+
+
+test_proxy_page = LazyPage(render_test_proxy)
+
+
+@app.get("/test-proxy", response_class=HTMLResponse)
+async def test_proxy(request: Request):
+    return test_proxy_page.response(request)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.response()
+
+
+@app.get("/static/{name}")
+async def static_asset(name: str, request: Request):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        return Response(status_code=404)
+    return asset.response(request)
 
 
 # ---------- Просмотр логов ----------
 
+# Строк таблицы в одном куске ответа
+VIEW_LOGS_CHUNK = 50
+# Больше записей за страницу не просим: страница должна оставаться дешёвой
+VIEW_LOGS_MAX_LIMIT = 500
+# Сколько строк держит таблица, дополняемая живым потоком
+VIEW_LOGS_LIVE_MAX_ROWS = 1000
+
+VIEW_LOGS_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8" />
+    <title>Логи identserver</title>
+    <style>
+        body { font-family: -apple-system,BlinkMacSystemFont,sans-serif; padding: 20px; }
+        form { margin-bottom: 12px; }
+        form label { margin-right: 10px; }
+        table { border-collapse: collapse; width: 100%; font-size: 13px; }
+        th, td { border: 1px solid #ddd; padding: 6px; vertical-align: top; }
+        th { background: #f5f5fa; }
+        td.ch { white-space: pre-wrap; word-break: break-all; font-family: monospace; }
+        .notice { color: #8a5a00; }
+    </style>
+</head>
+<body>
+    <h1>Логи identserver</h1>
+"""
+
+
+def view_logs_form(order: str, limit: int, filters: dict) -> str:
+    def selected(value, current):
+        return " selected" if value == current else ""
+
+    mode = filters.get("mode") or ""
+    return f"""
+    <form method="get" action="/view-logs">
+        <label>Порядок <select name="order">
+            <option value="desc"{selected("desc", order)}>сначала новые</option>
+            <option value="asc"{selected("asc", order)}>сначала старые</option>
+        </select></label>
+        <label>mode <select name="mode">
+            <option value=""{selected("", mode)}>все</option>
+            <option value="cross"{selected("cross", mode)}>cross</option>
+            <option value="proxy"{selected("proxy", mode)}>proxy</option>
+        </select></label>
+        <label>UID <input name="uid" size="34" value="{escape(filters.get("uid") or "")}"></label>
+        <label>User-Agent содержит <input name="ua" value="{escape(filters.get("ua") or "")}"></label>
+        <label>с <input name="since" placeholder="2025-01-01T00:00" value="{escape(filters.get("since") or "")}"></label>
+        <label>по <input name="until" value="{escape(filters.get("until") or "")}"></label>
+        <label>на странице <input name="limit" type="number" min="1" max="{VIEW_LOGS_MAX_LIMIT}" value="{limit}" style="width:5em"></label>
+        <button type="submit">Показать</button>
+    </form>
+    """
+
+
+def log_row(log: dict) -> str:
+    channels = log.get("channels") or {}
+    if isinstance(channels, dict):
+        channels = "\n".join(f"{k}: {v}" for k, v in channels.items() if v is not None)
+    return (
+        f"<tr data-key=\"{escape(str(log.get('uid', '')))}|{escape(str(log.get('timestamp', '')))}\">"
+        f"<td>{escape(str(log.get('timestamp', '')))}</td>"
+        f"<td>{escape(str(log.get('mode', '')))}</td>"
+        f"<td>{escape(str(log.get('uid', '')))}</td>"
+        f"<td class=\"ch\">{escape(str(channels))}</td>"
+        f"<td>{escape(str(log.get('userAgent', '')))}</td></tr>\n"
+    )
+
+
+def live_tail_script(stream_url: str) -> str:
+    """
+    Подписка на /logs/stream identserver: новые записи встают в начало
+    таблицы сразу, без перезагрузки. Уже показанные (uid + время) не дублируются.
+    """
+    return f"""
+    <p id="live" class="notice">Живой поток: подключаемся…</p>
+    <script>
+    (function () {{
+        var table = document.getElementById("logs");
+        var status = document.getElementById("live");
+        var seen = new Set();
+        table.querySelectorAll("tr[data-key]").forEach(function (tr) {{ seen.add(tr.dataset.key); }});
+
+        var source = new EventSource({json.dumps(stream_url)});
+        source.onopen = function () {{ status.textContent = "Живой поток: подключено"; }};
+        source.onerror = function () {{ status.textContent = "Живой поток: переподключаемся…"; }};
+        source.addEventListener("gap", function (e) {{
+            status.textContent = "Живой поток: пропущено записей — " + e.data + ", обновите страницу";
+        }});
+        source.onmessage = function (e) {{
+            var log = JSON.parse(e.data);
+            var key = log.uid + "|" + (log.timestamp || "");
+            if (seen.has(key)) return;
+            seen.add(key);
+
+            var empty = table.querySelector("tr.empty");
+            if (empty) empty.remove();
+            var ch = log.channels || {{}};
+            var channels = Object.keys(ch).filter(function (k) {{ return ch[k] != null; }})
+                .map(function (k) {{ return k + ": " + ch[k]; }}).join("\\n");
+            var tr = document.createElement("tr");
+            tr.dataset.key = key;
+            [log.timestamp, log.mode, log.uid, channels, log.userAgent].forEach(function (value, i) {{
+                var td = document.createElement("td");
+                td.textContent = value || "";
+                if (i === 3) td.className = "ch";
+                tr.appendChild(td);
+            }});
+            var header = table.rows[0];
+            header.parentNode.insertBefore(tr, header.nextSibling);
+            while (table.rows.length > {VIEW_LOGS_LIVE_MAX_ROWS} + 1) table.deleteRow(-1);
+        }};
+    }})();
+    </script>
+    """
+
+
 @app.get("/view-logs", response_class=HTMLResponse)
-def view_logs():
+async def view_logs(
+    after: int = Query(0, ge=0),
+    before: int = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=VIEW_LOGS_MAX_LIMIT),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    mode: str = None,
+    uid: str = None,
+    ua: str = None,
+    since: str = None,
+    until: str = None,
+):
+    """
+    Страница отдаётся потоком: шапка с фильтрами уходит сразу, до похода
+    в identserver, затем таблица кусками по VIEW_LOGS_CHUNK строк.
+    У identserver берём только одну страницу из limit записей
+    (после курсора after или, для order=desc, до курсора before),
+    фильтры применяются на его стороне — время ответа не зависит
+    от размера лога. Первая страница «сначала новые» дальше дополняется
+    живым потоком /logs/stream с identserver.
+    """
+    filters = {k: v for k, v in (("mode", mode), ("uid", uid), ("ua", ua),
+                                 ("since", since), ("until", until)) if v}
+    params = {"limit": limit, "order": order, **filters}
+    if order == "desc":
+        if before is not None:
+            params["before"] = before
+    else:
+        params["after"] = after
+
     try:
-        r = requests.get(f"{IDENTSERVER}/logs", timeout=5)
-        logs = r.json()
-    except:
-        logs = []
-
-    rows = ""
-    for log in logs:
-        rows += f"""
+        LogFilter(since=since, until=until)
+    except ValueError as e:
+        bad_filter = str(e)
+    else:
+        bad_filter = None
+
+    async def render():
+        yield VIEW_LOGS_HEAD + view_logs_form(order, limit, filters)
+        if bad_filter is not None:
+            # identserver ответил бы 422, а страница показала бы «недоступен»
+            yield f"""    <p class="notice">Неверный фильтр: {escape(bad_filter)}</p>
+    <p><a href="/view-logs">Сбросить фильтры</a></p>
+</body>
+</html>
+"""
+            return
+
+        result = await read_identserver("/logs", params, caller="view_logs")
+        logs = result.data if isinstance(result.data, list) else []
+        yield upstream_notice(result) + f"""
+    <table id="logs" data-upstream="{result.state}">
         <tr>
-            <td>{log.get("timestamp","")}</td>
-            <td>{log.get("mode","")}</td>
-            <td>{log.get("uid","")}</td>
-            <td><pre>{json.dumps(log.get("channels"), indent=2, ensure_ascii=False)}</pre></td>
-            <td>{log.get("userAgent","")}</td>
+            <th>Время</th>
+            <th>mode</th>
+            <th>UID</th>
+            <th>Каналы</th>
+            <th>User-Agent</th>
         </tr>
-        """
+"""
+        if not logs:
+            yield "<tr class='empty'><td colspan='5'>Пока нет логов</td></tr>\n"
+        for i in range(0, len(logs), VIEW_LOGS_CHUNK):
+            yield "".join(log_row(log) for log in logs[i:i + VIEW_LOGS_CHUNK])
+
+        links = []
+        base = {k: v for k, v in params.items() if k not in ("after", "before")}
+        if order == "desc" and before is not None:
+            links.append(f'<a href="/view-logs?{urlencode(base)}">← К новым</a>')
+        if result.headers.get("X-Has-More") == "1":
+            cursor = "before" if order == "desc" else "after"
+            next_params = {**base, cursor: result.headers["X-Next-Cursor"]}
+            label = "Старее →" if order == "desc" else "Дальше →"
+            links.append(f'<a href="/view-logs?{urlencode(next_params)}">{label}</a>')
+        live = ""
+        if order == "desc" and before is None:
+            # Продолжаем с того места, на котором identserver отдал страницу
+            stream_params = dict(filters)
+            if "X-Tail-Seq" in result.headers:
+                stream_params["after_seq"] = result.headers["X-Tail-Seq"]
+            live = live_tail_script(f"{IDENTSERVER}/logs/stream?{urlencode(stream_params)}")
+        yield f"""    </table>
+    {live}
+    <p>{" &nbsp; ".join(links)}</p>
+    <p><a href="/">Назад</a></p>
+</body>
+</html>
+"""
 
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8" />
-        <title>Логи identserver</title>
-        <style>
-            body {{ font-family: -apple-system,BlinkMacSystemFont,sans-serif; padding: 20px; }}
-            table {{ border-collapse: collapse; width: 100%; font-size: 13px; }}
-            th, td {{ border: 1px solid #ddd; padding: 6px; vertical-align: top; }}
-            th {{ background: #f5f5fa; }}
-            pre {{ margin: 0; white-space: pre-wrap; word-break: break-all; }}
-        </style>
-    </head>
-    <body>
-        <h1>Логи identserver</h1>
-        <table>
-            <tr>
-                <th>Время</th>
-                <th>mode</th>
-                <th>UID</th>
-                <th>Каналы</th>
-                <th>User-Agent</th>
-            </tr>
-            {rows or "<tr><td colspan='5'>Пока нет логов</td></tr>"}
-        </table>
-        <p><a href="/">Назад</a></p>
-    </body>
-    </html>
-    """
-    return HTMLResponse(html)
+    return StreamingResponse(render(), media_type="text/html; charset=utf-8")
 
 
 # ---------- Страница результатов автотестов + график ----------
 
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
 @app.get("/test-results", response_class=HTMLResponse)
-def test_results_page():
-    try:
-        r = requests.get(f"{IDENTSERVER}/test-results", timeout=5)
-        results = r.json()
-    except:
-        results = []
+async def test_results_page():
+    result = await read_identserver("/test-results", caller="test_results_page")
+    results = result.data if isinstance(result.data, list) else []
 
     # Таблица
     table_rows = ""
     chart_points = []
 
     for row in results:
+        # /save-test-result принимает что угодно: битая запись не должна ронять страницу
+        if not isinstance(row, dict):
+            continue
         browser = row.get("browser")
         stand = row.get("stand")
         uid1 = row.get("uid1")
         uid2 = row.get("uid2")
         stable = "OK" if uid1 and uid2 and uid1 == uid2 else "CHANGED"
+        # Время от навигации до UID (есть у результатов из tests/harness.py)
+        latency = " / ".join(
+            f"{row[k]:.0f}" if _is_number(row.get(k)) else "—" for k in ("uid1_ms", "uid2_ms"))
 
         table_rows += f"""
         <tr>
-            <td>{browser}</td>
-            <td>{stand}</td>
-            <td>{uid1}</td>
-            <td>{uid2}</td>
+            <td>{escape(str(browser))}</td>
+            <td>{escape(str(stand))}</td>
+            <td>{escape(str(uid1))}</td>
+            <td>{escape(str(uid2))}</td>
             <td>{stable}</td>
+            <td>{latency}</td>
         </tr>
         """
 
@@ -410,10 +590,12 @@ def test_results_page():
             th, td {{ border: 1px solid #ddd; padding: 6px; font-size: 13px; }}
             th {{ background: #f5f5fa; }}
             #chart-container {{ max-width: 700px; margin-top: 20px; }}
+            .notice {{ color: #8a5a00; }}
         </style>
     </head>
     <body>
         <h1>Результаты автотестов Safari vs Chrome</h1>
+        {upstream_notice(result)}
         <p>1 = UID стабильный между двумя запусками, 0 = UID изменился.</p>
 
         <div id="chart-container">
@@ -427,8 +609,9 @@ def test_results_page():
                 <th>UID (1 запуск)</th>
                 <th>UID (2 запуск)</th>
                 <th>Стабильность</th>
+                <th>До UID, мс (1 / 2)</th>
             </tr>
-            {table_rows or "<tr><td colspan='5'>Пока нет результатов</td></tr>"}
+            {table_rows or "<tr><td colspan='6'>Пока нет результатов</td></tr>"}
         </table>
 
         <p><a href="/">Назад</a></p>
@@ -468,4 +651,4 @@ def test_results_page():
     </body>
     </html>
     """
-    return HTMLResponse(html)
+    return with_upstream_state(html, result)
@@ -1,17 +1,125 @@
-from fastapi import FastAPI, Request, Response
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from collections import Counter
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from io import BytesIO
-from PIL import Image
+from functools import lru_cache
+import re
 import secrets
+import struct
+import zlib
 import json
 import os
+import time
 
-app = FastAPI()
+import msgspec
+
+from log_reader import LogFilter
+from log_schema import BodyTooLarge, decode_log_record, read_body
+from log_collector import SocketLogWriter
+from log_sink import LogSink
+from log_tail import LOG_TAIL_PING_S, LOG_TAIL_STREAM_S, LogTail
+from metrics import Metrics, MetricsMiddleware
+from profiler import install_profiler
+from static_pages import STATIC_ASSETS, LazyPage, three_ds_method_js
+from storage import make_storage
+from timing_stats import TimingStats
+from tracing import install_tracing
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Фоновая запись логов и спанов: запускается со стартом, дописывает всё на остановке
+    await log_sink.start()
+    await tracer.start()
+    try:
+        yield
+    finally:
+        await tracer.stop()
+        await log_sink.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 LOGFILE = "logs.jsonl"
 TEST_RESULTS_FILE = "test_results.json"
 
+# Сколько закодированных PNG держим в памяти (LRU по UID)
+PNG_CACHE_SIZE = int(os.environ.get("PNG_CACHE_SIZE", "4096"))
+
+# 304 на ревалидацию /cache.png; CACHE_PNG_304=0 — всегда 200 с телом, как раньше
+CACHE_PNG_304 = os.environ.get("CACHE_PNG_304", "1") != "0"
+
+# Так выглядят UID, которые выдаёт generate_uid()
+ISSUED_UID_RE = re.compile(r"[0-9a-f]{32}")
+
+# Ответы /cache.png по режиму стенда: (mode, "200"/"304") -> количество,
+# (mode, "bytes") -> сколько байт PNG отдали
+cache_png_counts = Counter()
+
+# Файлы или SQLite — по STORAGE_BACKEND (см. storage.py)
+storage = make_storage(LOGFILE, TEST_RESULTS_FILE)
+
+# С несколькими воркерами uvicorn пишет один процесс-коллектор, воркеры шлют
+# ему записи через Unix-сокет LOG_COLLECTOR_SOCKET (см. log_collector.py)
+LOG_COLLECTOR_SOCKET = os.environ.get("LOG_COLLECTOR_SOCKET")
+
+# Что делать с /log, когда очередь записи полна: block — ждать, drop — отбросить
+LOG_BACKPRESSURE = os.environ.get("LOG_BACKPRESSURE", "block")
+if LOG_BACKPRESSURE not in ("block", "drop"):
+    raise ValueError(f"unknown LOG_BACKPRESSURE: {LOG_BACKPRESSURE!r}")
+
+# Фоновая запись /log пачками (см. log_sink.py)
+if LOG_COLLECTOR_SOCKET:
+    log_sink = LogSink.from_env(SocketLogWriter(LOG_COLLECTOR_SOCKET))
+else:
+    log_sink = LogSink.from_env(storage.log_writer())
+
+# Последние записи /log в памяти для живого потока /logs/stream (см. log_tail.py).
+# У каждого воркера uvicorn свой буфер: поток видит записи только своего воркера
+log_tail = LogTail()
+log_sink.on_written = log_tail.extend
+
+# Перцентили клиентских таймингов по каналам (см. timing_stats.py)
+timing_stats = TimingStats()
+
+# Метрики для /metrics (см. metrics.py)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+metrics.gauge("log_records_written_total", lambda: log_sink.records_written,
+              "Записи /log, сброшенные на диск", kind="counter")
+metrics.gauge("log_bytes_written_total", lambda: log_sink.bytes_written,
+              "Байты логов, записанные на диск", kind="counter")
+metrics.gauge("log_write_errors_total", lambda: log_sink.errors,
+              "Ошибки записи пачек логов", kind="counter")
+metrics.gauge("log_lost_total", lambda: log_sink.lost,
+              "Записи /log из пачек, которые не удалось записать", kind="counter")
+metrics.gauge("log_dropped_total", lambda: log_sink.dropped,
+              "Записи /log, отброшенные при LOG_BACKPRESSURE=drop", kind="counter")
+metrics.gauge("log_queue_depth", lambda: log_sink.stats()["queue_depth"],
+              "Записи /log, ждущие сброса")
+metrics.gauge("log_tail_subscribers", lambda: log_tail.subscribers,
+              "Открытые подписки /logs/stream")
+metrics.gauge("log_flush_seconds_max", lambda: log_sink.max_flush_ms / 1000,
+              "Самый долгий сброс пачки логов")
+metrics.gauge(
+    "cache_png_responses_total",
+    lambda: {
+        (("mode", mode), ("status", status)): n
+        for (mode, status), n in list(cache_png_counts.items())
+        if status != "bytes"
+    },
+    "Ответы /cache.png по режиму и статусу",
+    kind="counter",
+)
+
+# Семплирующий профайлер — только при PROFILER_ENABLED=1 (см. profiler.py)
+profiler = install_profiler(app)
+
+# Спаны запросов, продолжающие traceparent от domain1 (см. tracing.py)
+tracer = install_tracing(app, "identserver")
+
 
 # Утилиты
 
@@ -19,11 +127,58 @@ def generate_uid() -> str:
     return secrets.token_hex(16)
 
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data))
+    )
+
+
+PNG_IEND = _png_chunk(b"IEND", b"")
+
+
+@lru_cache(maxsize=8)
+def _png_layout(width: int, height: int) -> tuple:
+    """
+    Неизменные части PNG для заданного размера:
+    сигнатура + IHDR (RGB, 8 бит) и «хвост» из белых строк (height > 1).
+    """
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    header = PNG_SIGNATURE + _png_chunk(b"IHDR", ihdr)
+    white_rows = (b"\x00" + b"\xff" * (width * 3)) * (height - 1)
+    return header, white_rows
+
+
+@lru_cache(maxsize=PNG_CACHE_SIZE)
 def uid_to_png(uid: str, width: int = 200, height: int = 1) -> bytes:
     """
     Кодируем UID (ascii-строка) в PNG: 3 символа на пиксель.
     Остальные пиксели заполняем (0,0,0) как маркер конца.
+
+    PNG собираем руками: первая строка — байты UID, добитые нулями
+    до width * 3, остальные строки белые. Результат кэшируется по UID,
+    поэтому повторная ревалидация горячего UID — это поиск в словаре.
     """
+    header, white_rows = _png_layout(width, height)
+    row_len = width * 3
+    data = uid.encode("ascii")[:row_len]
+    raw = b"\x00" + data + bytes(row_len - len(data)) + white_rows
+    return header + _png_chunk(b"IDAT", zlib.compress(raw)) + PNG_IEND
+
+
+def uid_to_png_pil(uid: str, width: int = 200, height: int = 1) -> bytes:
+    """
+    Эталонная (медленная) реализация через PIL — для сверки и бенчмарков.
+    PIL импортируется только здесь.
+    """
+    from io import BytesIO
+    from PIL import Image
+
     img = Image.new("RGB", (width, height), (255, 255, 255))
     pixels = img.load()
 
@@ -43,37 +198,85 @@ def uid_to_png(uid: str, width: int = 200, height: int = 1) -> bytes:
     img.save(buf, format="PNG")
     return buf.getvalue()
 
+def _etag_uid(header: str) -> str:
+    """UID из If-None-Match: первый entity-tag, без W/ и кавычек."""
+    tag = header.split(",", 1)[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag.strip('"')
+
+
+def _set_cache_headers(resp: Response, uid: str) -> None:
+    resp.headers["ETag"] = f'"{uid}"'
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    resp.headers["Expires"] = (
+        datetime.utcnow() + timedelta(days=365)
+    ).strftime("%a, %d %b %Y %H:%M:%S GMT")
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+
+
 @app.get("/cache.png")
 async def cache_png(request: Request):
     """
     Third-party ресурс с длинным кэшем.
     Safari / Chrome кэшируют его по URL + ETag (partitioned).
+    Ревалидация ETag, выданного нами, получает 304 без тела и без кодирования.
     """
+    # proxy-стенд (domain1) помечает свои запросы, остальное — cross
+    mode = request.headers.get("x-evercookie-mode", "cross")
+    if mode not in ("cross", "proxy"):
+        mode = "cross"
+
     etag_header = request.headers.get("if-none-match")
     if etag_header:
-        uid = etag_header.strip().strip('"')
+        uid = _etag_uid(etag_header)
+        if CACHE_PNG_304 and ISSUED_UID_RE.fullmatch(uid):
+            cache_png_counts[mode, "304"] += 1
+            resp = Response(status_code=304)
+            _set_cache_headers(resp, uid)
+            return resp
     else:
         uid = generate_uid()
 
-    png_bytes = uid_to_png(uid)
+    with tracer.span("png encode"):
+        png_bytes = uid_to_png(uid)
+    cache_png_counts[mode, "200"] += 1
+    cache_png_counts[mode, "bytes"] += len(png_bytes)
 
     resp = Response(png_bytes, media_type="image/png")
-    resp.headers["ETag"] = f'"{uid}"'
-    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
-    resp.headers["Expires"] = (
-        datetime.utcnow() + timedelta(days=365)
-    ).strftime("%a, %d %b %Y %H:%M:%S GMT")
-    resp.headers["Access-Control-Allow-Origin"] = "*"
+    _set_cache_headers(resp, uid)
     return resp
 
-@app.get("/3ds-method-cross", response_class=HTMLResponse)
-async def three_ds_method_cross():
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """
+    Сколько 200 и 304 отдал /cache.png по каждому режиму
+    и сколько байт PNG сэкономили 304 (по среднему размеру ответа 200).
+    """
+    out = {}
+    for mode in ("cross", "proxy"):
+        full = cache_png_counts[mode, "200"]
+        not_modified = cache_png_counts[mode, "304"]
+        sent = cache_png_counts[mode, "bytes"]
+        avg = sent / full if full else 0
+        out[mode] = {
+            "200": full,
+            "304": not_modified,
+            "bytes_sent": sent,
+            "bytes_saved_estimate": round(avg * not_modified),
+        }
+    out["conditional_304"] = CACHE_PNG_304
+    return out
+
+def render_three_ds_method_cross() -> str:
     """
     Страница, которую загружает cross-origin iframe у domain1.
     Здесь мы пробуем cookie/localStorage/sessionStorage/IndexedDB/PNG
     и постим результат в родителя + логируем.
+    Сама логика — в общем static/3ds-method.js, здесь только настройки.
     """
-    html = """
+    return f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -81,198 +284,214 @@ async def three_ds_method_cross():
     <title>3DS Method - CROSS</title>
 </head>
 <body>
-<script>
-// --- IndexedDB helpers ---
-function idb_get(dbName, storeName, key) {
-    return new Promise((resolve) => {
-        const req = indexedDB.open(dbName, 1);
-        req.onupgradeneeded = () => {
-            let db = req.result;
-            db.createObjectStore(storeName);
-        };
-        req.onsuccess = () => {
-            let db = req.result;
-            const tx = db.transaction(storeName, "readonly");
-            const store = tx.objectStore(storeName);
-            const r = store.get(key);
-            r.onsuccess = () => resolve(r.result || null);
-            r.onerror = () => resolve(null);
-        };
-        req.onerror = () => resolve(null);
-    });
-}
-
-function idb_set(dbName, storeName, key, value) {
-    return new Promise((resolve) => {
-        const req = indexedDB.open(dbName, 1);
-        req.onupgradeneeded = () => {
-            let db = req.result;
-            db.createObjectStore(storeName);
-        };
-        req.onsuccess = () => {
-            let db = req.result;
-            const tx = db.transaction(storeName, "readwrite");
-            const store = tx.objectStore(storeName);
-            store.put(value, key);
-            tx.oncomplete = () => resolve(true);
-            tx.onerror = () => resolve(false);
-        };
-        req.onerror = () => resolve(false);
-    });
-}
-
-// --- PNG cache ---
-class PNGCache {
-    constructor(endpoint) {
-        this.endpoint = endpoint;
-        this.canvasWidth = 200;
-    }
-    loadUID() {
-        return new Promise((resolve) => {
-            const img = new Image();
-            img.crossOrigin = "anonymous";
-            img.onload = () => {
-                const canvas = document.createElement("canvas");
-                canvas.width = this.canvasWidth;
-                canvas.height = 1;
-                const ctx = canvas.getContext("2d");
-                ctx.drawImage(img, 0, 0);
-                const pix = ctx.getImageData(0, 0, this.canvasWidth, 1).data;
-                let uid = "";
-                for (let i = 0; i < pix.length; i += 4) {
-                    const r = pix[i], g = pix[i+1], b = pix[i+2];
-                    if (r === 0 && g === 0 && b === 0) break;
-                    uid += String.fromCharCode(r);
-                    if (g !== 0) uid += String.fromCharCode(g);
-                    if (b !== 0) uid += String.fromCharCode(b);
-                }
-                resolve(uid || null);
-            };
-            img.onerror = () => resolve(null);
-            img.src = "/cache.png";
-        });
-    }
-}
-
-// --- main ---
-(async () => {
-    let cookieVal = null;
-    try {
-        const m = document.cookie.match(/device_id=([^;]+)/);
-        if (m) cookieVal = m[1];
-    } catch(e) {}
-
-    let lsVal = null;
-    try { lsVal = localStorage.getItem("device_id"); } catch(e){}
-
-    let ssVal = null;
-    try { ssVal = sessionStorage.getItem("device_id"); } catch(e){}
-
-    let idbVal = null;
-    try { idbVal = await idb_get("evercookieDB","store","device_id"); } catch(e){}
-
-    const png = new PNGCache("/cache.png");
-    let pngVal = null;
-    try { pngVal = await png.loadUID(); } catch(e){}
-
-    const candidates = [cookieVal, lsVal, ssVal, idbVal, pngVal].filter(Boolean);
-    let finalUID = candidates.length > 0 ? candidates[0] : null;
-    if (!finalUID) {
-        // PNG-значение предпочтительнее, если оно есть
-        finalUID = pngVal || Math.random().toString(16).slice(2, 18);
-    }
-
-    try { document.cookie = "device_id=" + finalUID + "; path=/; SameSite=None; Secure"; } catch(e){}
-    try { localStorage.setItem("device_id", finalUID); } catch(e){}
-    try { sessionStorage.setItem("device_id", finalUID); } catch(e){}
-    try { await idb_set("evercookieDB","store","device_id", finalUID); } catch(e){}
-
-    const channels = {
-        cookie: cookieVal,
-        localStorage: lsVal,
-        sessionStorage: ssVal,
-        indexedDB: idbVal,
-        pngCache: pngVal
-    };
-
-    // postMessage родителю
-    window.parent.postMessage({
-        type: "DEVICE_ID",
-        id: finalUID,
-        mode: "cross",
-        channels
-    }, "*");
-
-    // лог на сервер
-    fetch("/log", {
-        method: "POST",
-        headers: {"Content-Type": "application/json"},
-        body: JSON.stringify({
-            uid: finalUID,
-            mode: "cross",
-            channels,
-            userAgent: navigator.userAgent,
-            timestamp: new Date().toISOString()
-        })
-    }).catch(()=>{});
-})();
-</script>
+<script src="{three_ds_method_js.url}"
+        data-mode="cross"
+        data-png="/cache.png"
+        data-log="/log"
+        data-cookie-attrs="path=/; SameSite=None; Secure"></script>
 </body>
 </html>
 """
-    return HTMLResponse(html)
+
+
+three_ds_method_cross_page = LazyPage(render_three_ds_method_cross)
+
+
+@app.get("/3ds-method-cross", response_class=HTMLResponse)
+async def three_ds_method_cross(request: Request):
+    return three_ds_method_cross_page.response(request)
+
+@app.get("/static/{name}")
+async def static_asset(name: str, request: Request):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        return Response(status_code=404)
+    resp = asset.response(request)
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
+
+def _log_rejected(reason: str, status: int, detail: str) -> JSONResponse:
+    metrics.inc("log_rejected_total", {"reason": reason},
+                help_text="Отклонённые записи /log по причине")
+    resp = JSONResponse({"status": "error", "error": detail}, status_code=status)
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
 
 @app.post("/log")
 async def write_log(request: Request):
-    data = await request.json()
-    line = json.dumps(data, ensure_ascii=False)
-    with open(LOGFILE, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    """
+    Запись проверяется по схеме (log_schema.py): тело больше LOG_MAX_BODY — 413,
+    битый JSON или запись не по схеме — 422. Пишется каноническая форма.
+    """
+    try:
+        data = decode_log_record(await read_body(request))
+    except BodyTooLarge as e:
+        return _log_rejected("too_large", 413, str(e))
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        return _log_rejected("invalid", 422, str(e))
+    timing_stats.observe(data)
+    with tracer.span("log write"):
+        if LOG_BACKPRESSURE == "drop":
+            log_sink.put_nowait(data)
+        else:
+            await log_sink.put(data)
 
     resp = JSONResponse({"status": "ok"})
     resp.headers["Access-Control-Allow-Origin"] = "*"
     return resp
 
 
+@app.get("/timing-stats")
+async def get_timing_stats():
+    """
+    p50/p95/p99 клиентских таймингов (мс) по каждой метрике × mode × браузер.
+    Считаются на лету при приёме /log, с момента старта процесса.
+    """
+    return timing_stats.snapshot()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.response()
+
+
+@app.get("/log-stats")
+async def get_log_stats():
+    """Счётчики фоновой записи логов: глубина очереди, время сброса и т.д."""
+    return log_sink.stats()
+
+
+def _bad_filter(detail: str) -> JSONResponse:
+    resp = JSONResponse({"status": "error", "error": detail}, status_code=422)
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
+
 @app.get("/logs")
-async def get_logs():
-    if not os.path.exists(LOGFILE):
-        return []
-    out = []
-    with open(LOGFILE, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                out.append(json.loads(line))
-            except:
-                pass
-    return out
+async def get_logs(
+    after: int = Query(0, ge=0),
+    before: int = Query(None, ge=0),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(None, ge=1),
+    mode: str = None,
+    uid: str = None,
+    since: str = None,
+    until: str = None,
+    ua: str = None,
+    fmt: str = Query("json", alias="format"),
+):
+    """
+    Логи с курсорной пагинацией (?after=<offset>&limit=N) и фильтрами
+    mode / uid / since / until (ISO-время, иначе 422) / ua (подстрока user-agent).
+    order=desc — от новых к старым, следующая страница — ?before=<X-Next-Cursor>.
 
-@app.post("/save-test-result")
-async def save_test_result(request: Request):
-    data = await request.json()
+    format=json   — JSON-массив, курсор следующей страницы в X-Next-Cursor;
+    format=ndjson — поток по строке на запись, последняя строка {"cursor": N}.
+    """
+    try:
+        flt = LogFilter(mode, uid, since, until, ua)
+    except ValueError as e:
+        return _bad_filter(str(e))
+    query = storage.query_logs(after, limit, flt, order, before)
+    # С этого номера /logs/stream продолжит страницу: в буфере только записанное,
+    # так что до tail_seq всё уже в файле; записанное во время чтения может повториться
+    tail_seq = log_tail.seq
+
+    if fmt == "ndjson":
+        def stream():
+            for record in query:
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+            yield json.dumps({"cursor": query.cursor, "has_more": query.has_more}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    out = await run_in_threadpool(list, query)
+    resp = JSONResponse(out)
+    resp.headers["X-Next-Cursor"] = str(query.cursor)
+    resp.headers["X-Has-More"] = "1" if query.has_more else "0"
+    resp.headers["X-Tail-Seq"] = str(tail_seq)
+    return resp
 
-    if os.path.exists(TEST_RESULTS_FILE):
-        try:
-            with open(TEST_RESULTS_FILE, "r", encoding="utf-8") as f:
-                existing = json.load(f)
-        except:
-            existing = []
-    else:
-        existing = []
 
-    existing.append(data)
+@app.get("/logs/stream")
+async def stream_logs(
+    request: Request,
+    after_seq: int = Query(None, ge=0),
+    mode: str = None,
+    uid: str = None,
+    since: str = None,
+    until: str = None,
+    ua: str = None,
+):
+    """
+    Живой поток новых записей /log (Server-Sent Events) из буфера в памяти,
+    файл не читается. id события — seq записи; продолжить с места обрыва —
+    заголовок Last-Event-ID (EventSource шлёт его сам) или ?after_seq=.
+    Без них — только записи, пришедшие после подключения. Если часть
+    записей уже вытеснена из буфера, приходит событие gap с их числом.
+    Фильтры — как у /logs. Через LOG_TAIL_STREAM_S секунд поток
+    закрывается, EventSource сам переподключается с того же места.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        after = int(last_event_id)
+    elif after_seq is not None:
+        after = after_seq
+    else:
+        after = log_tail.seq
+    if after > log_tail.seq:
+        # identserver перезапускался и считает заново — отдаём весь буфер
+        after = 0
+    try:
+        flt = LogFilter(mode, uid, since, until, ua)
+    except ValueError as e:
+        return _bad_filter(str(e))
+
+    async def events():
+        last = after
+        log_tail.subscribers += 1
+        try:
+            yield f"retry: 3000\n: seq {log_tail.seq}\n\n"
+            deadline = time.monotonic() + LOG_TAIL_STREAM_S
+            while True:
+                timeout = min(LOG_TAIL_PING_S, deadline - time.monotonic())
+                if timeout <= 0:
+                    break  # клиент переподключится с Last-Event-ID
+                if not await log_tail.wait(last, timeout):
+                    yield ": ping\n\n"
+                    continue
+                entries, missed = log_tail.since(last)
+                out = [f"event: gap\ndata: {missed}\n\n"] if missed else []
+                for seq, record, line in entries:
+                    if flt.empty or flt.matches(record):
+                        out.append(f"id: {seq}\ndata: {line}\n\n")
+                if entries:
+                    last = entries[-1][0]
+                if out:
+                    yield "".join(out)
+        finally:
+            log_tail.subscribers -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "Access-Control-Allow-Origin": "*",
+    })
 
-    with open(TEST_RESULTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(existing, f, indent=2, ensure_ascii=False)
+@app.post("/save-test-result")
+async def save_test_result(request: Request):
+    """Один результат объектом или пачка списком (tests/harness.py шлёт пачки)."""
+    data = await request.json()
+    records = data if isinstance(data, list) else [data]
+    await run_in_threadpool(storage.append_test_results, records)
 
-    resp = JSONResponse({"status": "saved"})
+    resp = JSONResponse({"status": "saved", "count": len(records)})
     resp.headers["Access-Control-Allow-Origin"] = "*"
     return resp
 
 
 @app.get("/test-results")
 async def get_test_results():
-    if not os.path.exists(TEST_RESULTS_FILE):
-        return []
-    with open(TEST_RESULTS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return await run_in_threadpool(storage.test_results)
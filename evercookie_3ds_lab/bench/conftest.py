@@ -0,0 +1,22 @@
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Базовые линии лежат рядом с бенчмарками, а не в текущей директории
+DEFAULT_STORAGE = "file://" + os.path.join(BENCH_DIR, ".benchmarks")
+
+# Порог регрессии при --benchmark-compare, если не задан явно
+DEFAULT_COMPARE_FAIL = os.environ.get("BENCH_COMPARE_FAIL", "mean:20%")
+
+
+def pytest_configure(config):
+    option = config.option
+    if not hasattr(option, "benchmark_storage"):
+        return  # pytest-benchmark не установлен
+    if option.benchmark_storage == "file://./.benchmarks":
+        option.benchmark_storage = DEFAULT_STORAGE
+    if option.benchmark_compare and not option.benchmark_compare_fail:
+        from pytest_benchmark.utils import parse_compare_fail
+        option.benchmark_compare_fail = [parse_compare_fail(DEFAULT_COMPARE_FAIL)]
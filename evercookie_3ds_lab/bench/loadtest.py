@@ -0,0 +1,275 @@
+"""
+Нагрузочный прогон identserver и domain1.
+
+Поднимает оба приложения локально (uvicorn в отдельных процессах,
+domain1 смотрит на локальный identserver), гоняет сценарии с заданной
+конкурентностью и пишет RPS и p50/p95/p99 в JSON:
+
+    python bench/loadtest.py --concurrency 32 --duration 10
+    python bench/loadtest.py --compare bench/results/loadtest-<старый>.json
+
+Логи, база и сегменты прогона лежат во временном каталоге и удаляются
+после него; --keep оставляет каталог и печатает путь.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+LAB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(LAB_DIR, "bench", "results")
+
+# Заранее «выданный» UID: на ревалидацию identserver отвечает 304
+KNOWN_UID = "0123456789abcdef0123456789abcdef"
+
+LOG_RECORD = {
+    "uid": KNOWN_UID,
+    "mode": "cross",
+    "channels": {
+        "cookie": None,
+        "localStorage": KNOWN_UID,
+        "sessionStorage": None,
+        "indexedDB": KNOWN_UID,
+        "pngCache": KNOWN_UID,
+    },
+    "timings": {
+        "read": {"cookie": 0.1, "localStorage": 0.1, "sessionStorage": 0.1,
+                 "indexedDB": 4.2, "pngCache": 11.5},
+        "write": {"cookie": 0.2, "localStorage": 0.1, "sessionStorage": 0.1, "indexedDB": 3.1},
+        "resolve": 12.0,
+        "total": 16.4,
+    },
+    "userAgent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+                 "(KHTML, like Gecko) Version/17.0 Safari/605.1.15",
+    "timestamp": "2025-12-01T10:00:00.000Z",
+}
+
+# name -> (сервер, метод, путь, заголовки, тело, ожидаемые статусы)
+SCENARIOS = {
+    "cache_png_fresh": ("ident", "GET", "/cache.png", None, None, (200,)),
+    "cache_png_revalidate": ("ident", "GET", "/cache.png",
+                             {"If-None-Match": f'"{KNOWN_UID}"'}, None, (200, 304)),
+    "log_post": ("ident", "POST", "/log", None, LOG_RECORD, (200,)),
+    "three_ds_method_cross": ("ident", "GET", "/3ds-method-cross", None, None, (200,)),
+    "proxy_cache_png": ("domain1", "GET", "/proxy-cache.png", None, None, (200,)),
+    "proxy_cache_png_revalidate": ("domain1", "GET", "/proxy-cache.png",
+                                   {"If-None-Match": f'"{KNOWN_UID}"'}, None, (200, 304)),
+    "logs": ("ident", "GET", "/logs?limit=100", None, None, (200,)),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(module: str, port: int, workdir: str, env: dict, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app",
+         "--app-dir", LAB_DIR, "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir,
+        env={**os.environ, **env},
+    )
+
+
+def start_collector(workdir: str, socket_path: str) -> subprocess.Popen:
+    """Лог-коллектор для identserver с несколькими воркерами (см. log_collector.py)."""
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(LAB_DIR, "log_collector.py"), "--socket", socket_path],
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        if time.monotonic() > deadline or proc.poll() is not None:
+            raise RuntimeError("log collector did not start")
+        time.sleep(0.05)
+    return proc
+
+
+async def wait_ready(url: str, timeout: float = 15.0) -> float:
+    """Ждёт, пока сервер начнёт отвечать; возвращает время ожидания (с)."""
+    started = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - started < timeout:
+            try:
+                await client.get(url)
+                return time.perf_counter() - started
+            except httpx.TransportError:
+                await asyncio.sleep(0.05)
+    raise RuntimeError(f"server at {url} did not start in {timeout}s")
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, base_url: str, scenario: tuple,
+                       concurrency: int, duration: float) -> dict:
+    _, method, path, headers, body, expected = scenario
+    url = base_url + path
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                r = await client.request(method, url, headers=headers, json=body)
+                ok = r.status_code in expected
+            except httpx.HTTPError:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="evercookie-load-")
+    try:
+        return await _run(args, workdir)
+    finally:
+        if args.keep:
+            print(f"\nфайлы прогона: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _run(args, workdir: str) -> dict:
+    ident_port, domain_port = free_port(), free_port()
+    ident_url = f"http://127.0.0.1:{ident_port}"
+    domain_url = f"http://127.0.0.1:{domain_port}"
+    bases = {"ident": ident_url, "domain1": domain_url}
+
+    procs = []
+    ident_env = {}
+    if args.ident_workers > 1:
+        # Несколько воркеров пишут логи через один процесс-коллектор
+        socket_path = os.path.join(workdir, "log-collector.sock")
+        procs.append(start_collector(workdir, socket_path))
+        ident_env["LOG_COLLECTOR_SOCKET"] = socket_path
+    procs += [
+        start_server("app_identserver", ident_port, workdir, ident_env, args.ident_workers),
+        start_server("app_domain1", domain_port, workdir, {"IDENTSERVER": ident_url}),
+    ]
+    try:
+        startup = {
+            "identserver_s": round(await wait_ready(ident_url + "/log-stats"), 3),
+            "domain1_s": round(await wait_ready(domain_url + "/"), 3),
+        }
+        limits = httpx.Limits(max_connections=args.concurrency,
+                              max_keepalive_connections=args.concurrency)
+        results = {}
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            for name in args.scenarios:
+                scenario = SCENARIOS[name]
+                results[name] = await run_scenario(
+                    client, bases[scenario[0]], scenario, args.concurrency, args.duration)
+                print(f"{name:28} {results[name]['rps']:>9} rps  "
+                      f"p50 {results[name]['p50_ms']:>8} ms  "
+                      f"p95 {results[name]['p95_ms']:>8} ms  "
+                      f"p99 {results[name]['p99_ms']:>8} ms  "
+                      f"errors {results[name]['errors']}")
+    finally:
+        # Коллектор — последним: сначала воркеры отдают ему хвосты очередей
+        for proc in reversed(procs):
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    return {
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "concurrency": args.concurrency,
+        "ident_workers": args.ident_workers,
+        "duration_s": args.duration,
+        "startup": startup,
+        "scenarios": results,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=LAB_DIR, text=True,
+            stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nсравнение с {baseline_path} ({baseline.get('git_commit', '?')}):")
+    for name, now in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        rps = now["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        p99 = now["p99_ms"] / before["p99_ms"] - 1 if before["p99_ms"] else 0.0
+        print(f"{name:28} rps {rps:+.1%}  p99 {p99:+.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон стенда")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд на сценарий")
+    parser.add_argument("--ident-workers", type=int, default=1,
+                        help="воркеров uvicorn у identserver; больше 1 — с лог-коллектором")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument("--out", help="куда записать JSON с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--keep", action="store_true",
+                        help="не удалять временный каталог с логами и базой прогона")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nрезультаты: {out}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Микробенчмарки горячих функций identserver (pytest-benchmark).
+
+    pytest bench --benchmark-autosave        # записать базовую линию
+    pytest bench --benchmark-compare         # сравнить с последней, упасть при регрессии > 20%
+
+Большие объёмы /logs (100k и 1M строк) — только с BENCH_LARGE=1.
+"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app_identserver import uid_to_png, uid_to_png_pil
+from log_reader import LogQuery
+from log_schema import decode_log_record
+from log_sink import FileLogWriter, encode_record
+from storage import TestResultsFile
+
+BENCH_LARGE = os.environ.get("BENCH_LARGE") == "1"
+
+TYPICAL_UID = "9c04c799b1e96a5db24b203de0f225ee"
+
+TYPICAL_RECORD = {
+    "uid": TYPICAL_UID,
+    "mode": "cross",
+    "channels": {
+        "cookie": None,
+        "localStorage": TYPICAL_UID,
+        "sessionStorage": None,
+        "indexedDB": TYPICAL_UID,
+        "pngCache": TYPICAL_UID,
+    },
+    "timings": {
+        "read": {"cookie": 0.1, "localStorage": 0.1, "sessionStorage": 0.1,
+                 "indexedDB": 4.2, "pngCache": 11.5},
+        "write": {"cookie": 0.2, "localStorage": 0.1, "sessionStorage": 0.1, "indexedDB": 3.1},
+        "resolve": 12.0,
+        "total": 16.4,
+    },
+    "userAgent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+                 "(KHTML, like Gecko) Version/17.0 Safari/605.1.15",
+    "timestamp": "2025-12-01T10:00:00.000Z",
+}
+
+# Худшее, что ещё пропустит схема /log: UID, каналы и User-Agent предельной
+# длины, не-ASCII (в JSON — по два байта на символ)
+PADDED_UID = "uid-" + "ÿ" * 60
+WORST_RECORD = {
+    **TYPICAL_RECORD,
+    "uid": PADDED_UID,
+    "channels": {name: PADDED_UID for name in TYPICAL_RECORD["channels"]},
+    "userAgent": "ÿ" * 512,
+}
+
+TYPICAL_LINE = json.dumps(TYPICAL_RECORD, ensure_ascii=False)
+WORST_LINE = json.dumps(WORST_RECORD, ensure_ascii=False)
+
+
+# uid_to_png
+
+@pytest.mark.parametrize("length", [0, 32, 128, 600])
+def test_uid_to_png_encode(benchmark, length):
+    """Кодирование без LRU-кэша (холодный UID)."""
+    uid = ("0123456789abcdef" * 40)[:length]
+    benchmark(uid_to_png.__wrapped__, uid)
+
+
+def test_uid_to_png_cached(benchmark):
+    uid_to_png(TYPICAL_UID)
+    benchmark(uid_to_png, TYPICAL_UID)
+
+
+def test_uid_to_png_pil_reference(benchmark):
+    pytest.importorskip("PIL")
+    benchmark(uid_to_png_pil, TYPICAL_UID)
+
+
+# JSON записи /log
+
+@pytest.mark.parametrize("line", [TYPICAL_LINE, WORST_LINE], ids=["typical", "worst"])
+def test_log_record_decode(benchmark, line):
+    """Как в POST /log: разбор и проверка по схеме (log_schema.py)."""
+    body = line.encode("utf-8")
+    assert decode_log_record(body)["uid"]
+    benchmark(decode_log_record, body)
+
+
+@pytest.mark.parametrize("line", [TYPICAL_LINE, WORST_LINE], ids=["typical", "worst"])
+def test_log_record_encode(benchmark, line):
+    """Кодирование канонической записи в строку JSONL, как в LogSink."""
+    record = decode_log_record(line.encode("utf-8"))
+    benchmark(encode_record, record)
+
+
+# Дозапись лога
+
+@pytest.mark.parametrize("batch_size", [1, 500])
+def test_log_append(benchmark, tmp_path, batch_size):
+    writer = FileLogWriter(str(tmp_path / "logs.jsonl"))
+    batch = [TYPICAL_RECORD] * batch_size
+    try:
+        benchmark(writer.write_batch, batch)
+    finally:
+        writer.close()
+
+
+# Полное чтение /logs
+
+LOG_SIZES = [
+    10_000,
+    pytest.param(100_000, marks=pytest.mark.skipif(not BENCH_LARGE, reason="BENCH_LARGE=1")),
+    pytest.param(1_000_000, marks=pytest.mark.skipif(not BENCH_LARGE, reason="BENCH_LARGE=1")),
+]
+
+
+@pytest.fixture(scope="module")
+def log_files(tmp_path_factory):
+    cache = {}
+
+    def make(lines: int) -> str:
+        if lines not in cache:
+            path = tmp_path_factory.mktemp("logs") / f"logs-{lines}.jsonl"
+            row = (TYPICAL_LINE + "\n").encode("utf-8")
+            with open(path, "wb") as f:
+                for _ in range(lines // 1000):
+                    f.write(row * 1000)
+            cache[lines] = str(path)
+        return cache[lines]
+
+    return make
+
+
+@pytest.mark.parametrize("lines", LOG_SIZES)
+def test_logs_full_read(benchmark, log_files, lines):
+    path = log_files(lines)
+    result = benchmark.pedantic(lambda: list(LogQuery(path)), rounds=3, iterations=1)
+    assert len(result) == lines
+
+
+# save_test_result
+
+@pytest.mark.parametrize("existing", [100, 1_000, 10_000])
+def test_save_test_result(benchmark, tmp_path, existing):
+    path = tmp_path / "test_results.json"
+    record = {"browser": "Safari", "stand": "cross", "uid1": TYPICAL_UID, "uid2": TYPICAL_UID}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([record] * existing, f)
+    store = TestResultsFile(str(path), compact_every=0)
+    store.records()
+    benchmark(store.append, record)
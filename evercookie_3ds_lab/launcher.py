@@ -0,0 +1,118 @@
+"""
+Оба приложения в одном процессе — для локального прогона и CI.
+
+domain1 и identserver слушают каждый свой адрес, как при раздельном
+запуске, но обращения domain1 к identserver (proxy-cache.png, view-logs,
+test-results) по умолчанию идут в приложение identserver напрямую,
+через httpx.ASGITransport, без сети.
+
+    python launcher.py
+    python launcher.py --domain1 127.0.0.1:8000 --identserver 127.0.0.1:8001
+    python launcher.py --transport http    # domain1 -> identserver по настоящему HTTP
+    python launcher.py --cold-start        # замерить холодный старт и выйти
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import asyncio
+import os
+
+import httpx
+import uvicorn
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} ms"
+
+
+def _split(address: str) -> tuple:
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def load_apps(identserver_url: str, transport: str) -> tuple:
+    # Ссылки на identserver в страницах domain1 — на адрес из launcher
+    os.environ.setdefault("IDENTSERVER", identserver_url)
+    import app_identserver
+    import app_domain1
+
+    if transport == "asgi":
+        app_domain1.upstream.use_transport(httpx.ASGITransport(app=app_identserver.app))
+    return app_identserver.app, app_domain1.app
+
+
+async def wait_started(servers: list) -> None:
+    while not all(s.started for s in servers):
+        if any(s.should_exit for s in servers):
+            raise RuntimeError("server failed to start")
+        await asyncio.sleep(0.005)
+
+
+async def first_requests(domain_url: str, identserver_url: str) -> dict:
+    """Первые запросы к страницам: шаблоны рендерятся и сжимаются здесь, а не на старте."""
+    timings = {}
+    async with httpx.AsyncClient() as client:
+        for url in (f"{domain_url}/", f"{domain_url}/test-proxy",
+                    f"{identserver_url}/3ds-method-cross", f"{domain_url}/proxy-cache.png"):
+            started = time.perf_counter()
+            r = await client.get(url, headers={"Accept-Encoding": "gzip, br"})
+            timings[url] = (r.status_code, time.perf_counter() - started)
+    return timings
+
+
+async def run(args) -> None:
+    domain_host, domain_port = _split(args.domain1)
+    ident_host, ident_port = _split(args.identserver)
+    domain_url = f"http://{domain_host}:{domain_port}"
+    identserver_url = f"http://{ident_host}:{ident_port}"
+
+    imports_started = time.perf_counter()
+    ident_app, domain_app = load_apps(identserver_url, args.transport)
+    imported = time.perf_counter()
+
+    ident = uvicorn.Server(uvicorn.Config(
+        ident_app, host=ident_host, port=ident_port, log_level=args.log_level))
+    domain = uvicorn.Server(uvicorn.Config(
+        domain_app, host=domain_host, port=domain_port, log_level=args.log_level))
+    # domain1 запускается вторым: по Ctrl+C он останавливается первым,
+    # identserver — после него (uvicorn передаёт сигнал дальше по цепочке)
+    serving = asyncio.gather(ident.serve(), domain.serve())
+
+    await wait_started([ident, domain])
+    ready = time.perf_counter()
+    print(f"identserver: {identserver_url}  domain1: {domain_url}  "
+          f"(domain1 -> identserver: {args.transport})")
+    print(f"cold start: uvicorn/httpx {_ms(imports_started - _STARTED)}, "
+          f"apps {_ms(imported - imports_started)}, "
+          f"servers {_ms(ready - imported)}, total {_ms(ready - _STARTED)}")
+
+    if args.cold_start:
+        for url, (status, elapsed) in (await first_requests(domain_url, identserver_url)).items():
+            print(f"first request {url}: {status} in {_ms(elapsed)}")
+        domain.should_exit = True
+        ident.should_exit = True
+
+    await serving
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="domain1 + identserver в одном процессе")
+    parser.add_argument("--domain1", default="domain1.local:8000", help="host:port для domain1")
+    parser.add_argument("--identserver", default="identserver.local:8001",
+                        help="host:port для identserver")
+    parser.add_argument("--transport", choices=("asgi", "http"), default="asgi",
+                        help="как domain1 ходит в identserver: в памяти или по HTTP")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="замерить старт и первые запросы, затем выйти")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
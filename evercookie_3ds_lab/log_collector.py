@@ -0,0 +1,185 @@
+"""
+Лог-коллектор для identserver с несколькими воркерами uvicorn.
+
+Один процесс владеет logs.jsonl (или SQLite): воркеры не пишут в файл
+сами, а шлют готовые строки JSONL через Unix-сокет, коллектор пишет их
+своим LogSink пачками. Строки не перемешиваются, group commit — один
+на все воркеры.
+
+    python log_collector.py --socket log-collector.sock &
+    LOG_COLLECTOR_SOCKET=log-collector.sock uvicorn app_identserver:app --workers 4
+
+Backpressure. Воркер копит записи в своей очереди LogSink и отправляет
+их пачкой одним sendall. Если коллектор не успевает, он перестаёт
+читать сокет, sendall у воркера блокируется, и его очередь растёт.
+Когда она заполнится (LOG_QUEUE_SIZE):
+  LOG_BACKPRESSURE=block  — обработчик /log ждёт места в очереди (ничего не теряем,
+                            растёт латентность /log);
+  LOG_BACKPRESSURE=drop   — запись отбрасывается, /log отвечает сразу,
+                            отброшенные видны в /log-stats (dropped).
+Если коллектор недоступен, пачка считается ошибкой записи (errors в /log-stats).
+
+Остановка. Коллектор перестаёт принимать соединения и дочитывает открытые
+до EOF (воркер закрывает сокет на своём shutdown), не дольше
+LOG_COLLECTOR_DRAIN_S; только потом дописывает и закрывает sink. Поэтому
+коллектор останавливают последним. Соединения, не закрывшиеся за это
+время, обрываются, и недочитанное в них теряется — их число в abandoned.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+
+from log_sink import LogSink, encode_record
+from storage import make_storage
+
+DEFAULT_SOCKET = "log-collector.sock"
+
+# Самая длинная строка, которую примет коллектор (тело /log ограничено сильно меньше)
+MAX_LINE = 1 << 20
+
+# Сколько секунд на остановке ждать, пока воркеры закроют свои соединения
+LOG_COLLECTOR_DRAIN_S = float(os.environ.get("LOG_COLLECTOR_DRAIN_S", "10"))
+
+
+class SocketLogWriter:
+    """
+    Writer для LogSink воркера: пачка уходит в коллектор одним sendall.
+    Соединение открывается при первой пачке и переоткрывается после обрыва.
+    """
+
+    def __init__(self, path: str, connect_timeout: float = 2.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._sock = None
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        # Дальше блокируемся сколько нужно: это и есть backpressure
+        sock.settimeout(None)
+        return sock
+
+    def write_batch(self, batch: list) -> int:
+        """
+        Отправляет пачку, после обрыва — один раз переподключается и досылает.
+        Досылаем не всю пачку, а с начала строки, на которой оборвались:
+        целые строки до неё коллектор уже принял, обрывок он отбрасывает.
+        """
+        data = b"".join(encode_record(r) for r in batch)
+        view = memoryview(data)
+        sent = 0
+        retried = False
+        while sent < len(data):
+            if self._sock is None:
+                self._sock = self._connect()
+            try:
+                sent += self._sock.send(view[sent:])
+            except OSError:
+                self.close()
+                if retried:
+                    raise
+                retried = True
+                sent = data.rfind(b"\n", 0, sent) + 1
+        return len(data)
+
+    def sync(self) -> None:
+        # fsync делает коллектор по своей политике LOG_FSYNC
+        pass
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class LogCollector:
+    """Принимает строки от воркеров и кладёт их в один LogSink."""
+
+    def __init__(self, sink: LogSink, path: str, drain_timeout: float = LOG_COLLECTOR_DRAIN_S):
+        self.sink = sink
+        self.path = path
+        self.drain_timeout = drain_timeout
+        self.abandoned = 0
+        self._server = None
+        self._handlers = set()
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # сокет от прошлого запуска
+        await self.sink.start()
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_LINE)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Принятые соединения, чей обработчик ещё не начал работу, — пусть встанут в _handlers
+            await asyncio.sleep(0)
+            if self._handlers:
+                # Строки, которые воркер уже отправил, лежат в сокете: дочитываем до EOF
+                _, pending = await asyncio.wait(set(self._handlers), timeout=self.drain_timeout)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                self.abandoned += len(pending)
+            await self._server.wait_closed()
+            self._server = None
+        await self.sink.stop()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break  # воркер закрыл соединение; обрывок строки не пишем
+                except asyncio.LimitOverrunError:
+                    self.sink.errors += 1
+                    break
+                # Очередь полна — ждём и не читаем сокет, воркер упрётся в sendall
+                await self.sink.put(line)
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+
+async def serve(path: str, logfile: str) -> None:
+    storage = make_storage(logfile, "test_results.json")
+    collector = LogCollector(LogSink.from_env(storage.log_writer()), path)
+    await collector.start()
+    print(f"log collector: {path} -> {getattr(storage, 'logfile', 'sqlite')}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await collector.stop()
+    if collector.abandoned:
+        print(f"log collector: {collector.abandoned} connection(s) not closed within "
+              f"{collector.drain_timeout:g}s, unread lines in them are lost")
+    print(f"log collector stopped: {collector.sink.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Лог-коллектор identserver")
+    parser.add_argument("--socket", default=os.environ.get("LOG_COLLECTOR_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--logfile", default="logs.jsonl",
+                        help="куда писать при STORAGE_BACKEND=file (как у identserver)")
+    args = parser.parse_args()
+    asyncio.run(serve(args.socket, args.logfile))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import bisect
+import fcntl
+import gzip
+import io
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+
+# Символы, которые json.dumps экранирует: по строке с ними нельзя
+# делать быстрый поиск подстроки в сырой JSON-строке.
+_JSON_ESCAPED = set('"\\') | {chr(c) for c in range(0x20)}
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        # Без зоны считаем, что это UTC (как toISOString в браузере)
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+def _parse_filter_ts(name: str, value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    ts = _parse_ts(value)
+    if ts is None:
+        # Молча без фильтра отдали бы весь лог
+        raise ValueError(f"{name}: expected ISO time, got {value!r}")
+    return ts
+
+
+def normalize_ts(value) -> Optional[str]:
+    """ISO-время в едином виде (UTC, микросекунды) — годится для сравнения строк."""
+    ts = _parse_ts(value)
+    if ts is None:
+        return None
+    return ts.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def browser_family(user_agent) -> str:
+    """Грубое семейство браузера по user-agent: Edge / Chrome / Firefox / Safari / other."""
+    if not isinstance(user_agent, str):
+        return "other"
+    if "Edg/" in user_agent:
+        return "Edge"
+    if "Firefox/" in user_agent or "FxiOS" in user_agent:
+        return "Firefox"
+    if "Chrome/" in user_agent or "Chromium/" in user_agent or "CriOS" in user_agent:
+        return "Chrome"
+    if "Safari/" in user_agent:
+        return "Safari"
+    return "other"
+
+
+class LogFilter:
+    """
+    Серверные фильтры для /logs: точное совпадение mode/uid,
+    диапазон timestamp [since, until] и подстрока user-agent.
+    Неразбираемые since/until — ValueError.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        uid: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        ua: Optional[str] = None,
+    ):
+        self.mode = mode or None
+        self.uid = uid or None
+        self.since = _parse_filter_ts("since", since)
+        self.until = _parse_filter_ts("until", until)
+        self.ua = ua.lower() if ua else None
+
+        # Строки, которые обязаны встретиться в сырой строке лога
+        # (user-agent ищем без учёта регистра — для него так нельзя)
+        self._needles = [
+            n.encode("utf-8")
+            for n in (self.mode, self.uid)
+            if n and not (set(n) & _JSON_ESCAPED)
+        ]
+
+    @property
+    def empty(self) -> bool:
+        return not (self.mode or self.uid or self.since or self.until or self.ua)
+
+    def may_match_line(self, line: bytes) -> bool:
+        """Дешёвая проверка до json.loads: отсекает заведомо чужие строки."""
+        return all(n in line for n in self._needles)
+
+    def matches(self, record) -> bool:
+        if not isinstance(record, dict):
+            return self.empty
+        if self.mode is not None and record.get("mode") != self.mode:
+            return False
+        if self.uid is not None and record.get("uid") != self.uid:
+            return False
+        if self.since is not None or self.until is not None:
+            ts = _parse_ts(record.get("timestamp"))
+            if ts is None:
+                return False
+            if self.since is not None and ts < self.since:
+                return False
+            if self.until is not None and ts > self.until:
+                return False
+        if self.ua is not None:
+            agent = record.get("userAgent")
+            if not isinstance(agent, str) or self.ua not in agent.lower():
+                return False
+        return True
+
+
+def _lines_from(f, base: int = 0, skip: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Строки открытого файла начиная с позиции skip; смещения — от base."""
+    if skip:
+        f.seek(skip)
+    offset = base + skip
+    for line in f:
+        if not line.endswith(b"\n"):
+            break
+        offset += len(line)
+        yield offset, line
+
+
+def _lines_reverse_from(f, base: int = 0, before: Optional[int] = None,
+                        block_size: int = 1 << 16) -> Iterator[Tuple[int, bytes]]:
+    """Строки открытого файла до позиции before, с конца; смещения — от base."""
+    size = f.seek(0, os.SEEK_END)
+    pos = size if before is None else min(before, size)
+    buf = b""
+    trimmed = False
+    while pos > 0:
+        read = min(block_size, pos)
+        pos -= read
+        f.seek(pos)
+        buf = f.read(read) + buf
+        if not trimmed:
+            # Хвост без \n — недописанная строка, её не отдаём
+            nl = buf.rfind(b"\n")
+            if nl == -1:
+                continue
+            buf = buf[:nl + 1]
+            trimmed = True
+        # buf = [pos, ...) и кончается на \n; первая строка в нём может быть неполной
+        while True:
+            i = buf.rfind(b"\n", 0, len(buf) - 1)
+            if i == -1:
+                break
+            yield base + pos + i + 1, buf[i + 1:]
+            buf = buf[:i + 1]
+    if trimmed and buf:
+        yield base, buf
+
+
+# ---------- Сегменты (см. log_rotation.py) ----------
+
+def segments_dir(path: str) -> str:
+    return path + ".segments"
+
+
+def load_manifest(path: str) -> dict:
+    """
+    Манифест сегментов лога path. active_start — сквозное смещение начала
+    активного файла, у сегмента: name, start, bytes, count, min_ts, max_ts
+    и blocks — [смещение в сегменте, смещение в .gz] начала каждого gzip-блока.
+    """
+    try:
+        with open(os.path.join(segments_dir(path), "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"active_start": 0, "next": 1, "segments": []}
+
+
+@contextmanager
+def log_lock(path: str, exclusive: bool):
+    """flock на path.lock: ротация — эксклюзивно, снимок для чтения — разделяемо."""
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def open_segment(path: str, segment: dict):
+    """Файл сегмента как есть: .gz читается по блокам, см. _segment_lines."""
+    return open(os.path.join(segments_dir(path), segment["name"]), "rb")
+
+
+def _segment_lines(f, segment: dict, skip: int) -> Iterator[Tuple[int, bytes]]:
+    base = segment["start"]
+    if not segment["name"].endswith(".gz"):
+        yield from _lines_from(f, base, skip)
+        return
+    # Разжимаем с блока, в котором лежит skip, а не с начала сегмента
+    blocks = segment.get("blocks") or [[0, 0]]
+    plain, packed = blocks[max(bisect.bisect_right([b[0] for b in blocks], skip) - 1, 0)]
+    f.seek(packed)
+    with gzip.GzipFile(fileobj=f, mode="rb") as gz:
+        yield from _lines_from(gz, base + plain, skip - plain)
+
+
+def _segment_lines_reverse(f, segment: dict, before: Optional[int]) -> Iterator[Tuple[int, bytes]]:
+    base = segment["start"]
+    if not segment["name"].endswith(".gz"):
+        yield from _lines_reverse_from(f, base, before)
+        return
+    # gzip назад не читается: разжимаем по одному блоку (LOG_SEGMENT_BLOCK_KB),
+    # начиная с того, где лежит before. У сегментов без blocks блок один — весь сегмент
+    blocks = segment.get("blocks") or [[0, 0]]
+    ends = [b[1] for b in blocks[1:]] + [os.fstat(f.fileno()).st_size]
+    for (plain, packed), end in reversed(list(zip(blocks, ends))):
+        if before is not None and plain >= before:
+            continue
+        f.seek(packed)
+        data = io.BytesIO(gzip.decompress(f.read(end - packed)))
+        yield from _lines_reverse_from(data, base + plain, None if before is None else before - plain)
+
+
+def _iso(ts: Optional[datetime]) -> Optional[str]:
+    return ts.astimezone(timezone.utc).isoformat(timespec="microseconds") if ts else None
+
+
+def segment_in_window(segment: dict, since: Optional[datetime], until: Optional[datetime]) -> bool:
+    """Могут ли в сегменте быть записи из [since, until] (по min_ts/max_ts из манифеста)."""
+    if since is None and until is None:
+        return True
+    if segment.get("count") is None:
+        return True  # ещё не просканирован
+    if segment.get("min_ts") is None:
+        return False  # записей со временем нет, фильтр по времени их всё равно отбросит
+    if since is not None and segment["max_ts"] < _iso(since):
+        return False
+    if until is not None and segment["min_ts"] > _iso(until):
+        return False
+    return True
+
+
+class SegmentedLog:
+    """
+    Активный logs.jsonl вместе с запечатанными сегментами как один лог.
+    Смещения сквозные: сегмент начинается с start из манифеста, активный
+    файл — с active_start, поэтому курсоры /logs переживают ротацию.
+    Сегменты вне окна since/until пропускаются не открывая.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _snapshot(self) -> tuple:
+        # Под замком ротация не переименует активный файл между чтением манифеста и open
+        with log_lock(self.path, exclusive=False):
+            manifest = load_manifest(self.path)
+            try:
+                active = open(self.path, "rb")
+            except FileNotFoundError:
+                active = None
+        return manifest, active
+
+    def _open(self, segment: dict) -> tuple:
+        """
+        (файл, сегмент); если сегмент успели сжать или удалить — смотрим
+        в манифест ещё раз. (None, None) — сегмента больше нет.
+        """
+        try:
+            return open_segment(self.path, segment), segment
+        except FileNotFoundError:
+            pass
+        for s in load_manifest(self.path)["segments"]:
+            if s["start"] == segment["start"]:
+                try:
+                    return open_segment(self.path, s), s
+                except FileNotFoundError:
+                    break
+        return None, None
+
+    def lines(self, after: int = 0, since: Optional[datetime] = None,
+              until: Optional[datetime] = None) -> Iterator[Tuple[int, bytes]]:
+        """
+        Строки всего лога после сквозного смещения after, от старых к новым:
+        (сквозное смещение конца строки, строка). Недописанную последнюю
+        строку активного файла (без \\n) не отдаёт — её дочитает следующий запрос.
+        """
+        manifest, active = self._snapshot()
+        try:
+            for segment in manifest["segments"]:
+                if segment["start"] + segment["bytes"] <= after:
+                    continue
+                if not segment_in_window(segment, since, until):
+                    continue
+                f, segment = self._open(segment)
+                if f is None:
+                    continue
+                with f:
+                    yield from _segment_lines(f, segment, max(after - segment["start"], 0))
+            if active is not None:
+                start = manifest["active_start"]
+                yield from _lines_from(active, start, max(after - start, 0))
+        finally:
+            if active is not None:
+                active.close()
+
+    def lines_reverse(self, before: Optional[int] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None) -> Iterator[Tuple[int, bytes]]:
+        """
+        Строки, целиком лежащие до сквозного смещения before (по умолчанию —
+        до конца лога), от новых к старым: (сквозное смещение начала строки,
+        строка). Активный файл читается блоками с конца; в сжатом сегменте
+        разжимается по одному gzip-блоку, так что память не зависит
+        от размера сегмента.
+        """
+        manifest, active = self._snapshot()
+        try:
+            start = manifest["active_start"]
+            if active is not None and (before is None or before > start):
+                yield from _lines_reverse_from(active, start, None if before is None else before - start)
+        finally:
+            if active is not None:
+                active.close()
+        for segment in reversed(manifest["segments"]):
+            if before is not None and segment["start"] >= before:
+                continue
+            if not segment_in_window(segment, since, until):
+                continue
+            f, segment = self._open(segment)
+            if f is None:
+                continue
+            limit = None if before is None else before - segment["start"]
+            with f:
+                yield from _segment_lines_reverse(f, segment, limit)
+
+
+class LogQuery:
+    """
+    Итератор по записям лога с фильтрами и лимитом.
+
+    После (или во время) итерации cursor — сквозное байтовое смещение
+    (через все сегменты, см. SegmentedLog), с которого нужно продолжить,
+    has_more — упёрлись ли в limit.
+    order="asc" — от старых к новым, продолжать с ?after=<cursor>;
+    order="desc" — от новых к старым, продолжать с ?before=<cursor>.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        after: int = 0,
+        limit: Optional[int] = None,
+        flt: Optional[LogFilter] = None,
+        order: str = "asc",
+        before: Optional[int] = None,
+    ):
+        self.path = path
+        self.after = after
+        self.before = before
+        self.limit = limit
+        self.flt = flt or LogFilter()
+        self.order = order
+        self.cursor = after if order == "asc" else (before or 0)
+        self.has_more = False
+
+    def _lines(self) -> Iterator[Tuple[int, bytes]]:
+        log = SegmentedLog(self.path)
+        if self.order == "desc":
+            return log.lines_reverse(self.before, self.flt.since, self.flt.until)
+        return log.lines(self.after, self.flt.since, self.flt.until)
+
+    def __iter__(self) -> Iterator[dict]:
+        flt = self.flt
+        count = 0
+        for offset, line in self._lines():
+            if self.limit is not None and count >= self.limit:
+                self.has_more = True
+                return
+            self.cursor = offset
+            if not flt.empty and not flt.may_match_line(line):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not flt.matches(record):
+                continue
+            count += 1
+            yield record
@@ -0,0 +1,325 @@
+"""
+Ротация logs.jsonl в запечатанные сжатые сегменты.
+
+    logs.jsonl                               — активный файл, сюда пишет LogSink
+    logs.jsonl.segments/00000001.jsonl.gz    — запечатанные сегменты (gzip)
+    logs.jsonl.segments/manifest.json        — по сегменту: сквозное смещение и размер,
+                                               число записей, диапазон timestamp,
+                                               смещения gzip-блоков
+    logs.jsonl.lock                          — flock: переименование эксклюзивно,
+                                               чтение и дозапись разделяемо
+
+Когда активный файл дорастает до LOG_ROTATE_MB или живёт дольше
+LOG_ROTATE_SECONDS, writer после очередной пачки переименовывает его
+в сегмент, сжимает и сканирует (число записей, min/max timestamp для
+пропуска сегментов по since/until). LOG_RETAIN_SEGMENTS > 0 — хранить
+только столько последних сегментов. Читает всё это SegmentedLog
+(log_reader.py): /logs, импорт в SQLite, bench.
+
+Писателей может быть несколько (воркеры uvicorn без коллектора): каждый
+перед пачкой под разделяемым замком сверяет inode своего дескриптора
+с logs.jsonl и после чужой ротации открывает файл заново. Ротацию ведёт
+один процесс за раз (flock на каталоге сегментов) и только если его
+дескриптор всё ещё смотрит на активный файл.
+
+    python log_rotation.py --logfile logs.jsonl          # сегменты и их диапазоны
+    python log_rotation.py --logfile logs.jsonl --seal   # запечатать сейчас (identserver остановлен!)
+"""
+import argparse
+import fcntl
+import gzip
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+import msgspec
+
+from log_reader import load_manifest, log_lock, normalize_ts, segments_dir
+from log_sink import FileLogWriter
+
+# Размер активного файла, после которого он запечатывается; 0 — не ротировать по размеру
+LOG_ROTATE_MB = float(os.environ.get("LOG_ROTATE_MB", "32"))
+# Возраст активного файла (сек, с первой записи этим процессом); 0 — не ротировать по времени
+LOG_ROTATE_SECONDS = float(os.environ.get("LOG_ROTATE_SECONDS", "0"))
+# Сколько последних сегментов хранить; 0 — все
+LOG_RETAIN_SEGMENTS = int(os.environ.get("LOG_RETAIN_SEGMENTS", "0"))
+# Сегмент сжимается независимыми gzip-блоками примерно такого размера (КиБ, без сжатия):
+# чтение с конца и с курсора разжимает один блок, а не весь сегмент
+LOG_SEGMENT_BLOCK_KB = int(os.environ.get("LOG_SEGMENT_BLOCK_KB", "1024"))
+
+_SEGMENT_RE = re.compile(r"(\d{8})\.jsonl(\.gz)?")
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    """Атомарно: временный файл + os.replace. Вызывать под log_lock(path, exclusive=True)."""
+    target = os.path.join(segments_dir(path), "manifest.json")
+    tmp = target + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, target)
+
+
+@contextmanager
+def rotation_lock(path: str, blocking: bool = True):
+    """
+    flock на каталоге сегментов на всю ротацию (переименование, сжатие,
+    удаление старых) или восстановление. Отдаёт False, если blocking=False
+    и ротацию уже ведёт другой процесс.
+    """
+    directory = segments_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def seal(path: str, retain: int = 0, inode: Optional[int] = None) -> Optional[dict]:
+    """
+    Запечатывает активный файл в новый сегмент. Ничего не делает, если файл
+    пуст, если ротацию уже ведёт другой процесс или если inode задан и
+    активный файл уже другой (его успел запечатать другой писатель).
+    """
+    if not os.path.exists(path):
+        return None
+    with rotation_lock(path, blocking=False) as locked:
+        if not locked:
+            return None
+        with log_lock(path, exclusive=True):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return None
+            if not st.st_size or (inode is not None and st.st_ino != inode):
+                return None
+            manifest = load_manifest(path)
+            name = f"{manifest['next']:08d}.jsonl"
+            os.replace(path, os.path.join(segments_dir(path), name))
+            segment = _register(manifest, name, st.st_size)
+            save_manifest(path, manifest)
+        segment = compress_segment(path, segment)
+        if retain:
+            drop_old_segments(path, retain)
+    return segment
+
+
+def _register(manifest: dict, name: str, size: int) -> dict:
+    segment = {
+        "name": name,
+        "start": manifest["active_start"],
+        "bytes": size,
+        "count": None,
+        "min_ts": None,
+        "max_ts": None,
+        "sealed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    manifest["segments"].append(segment)
+    manifest["next"] = int(name[:8]) + 1
+    manifest["active_start"] += size
+    return segment
+
+
+def _write_block(out, lines: list, blocks: list, plain: int) -> None:
+    blocks.append([plain, out.tell()])
+    out.write(gzip.compress(b"".join(lines), compresslevel=6, mtime=0))
+
+
+def compress_segment(path: str, segment: dict) -> dict:
+    """
+    Сжимает сегмент блоками по LOG_SEGMENT_BLOCK_KB (каждый — отдельный
+    gzip-член, режется по границе строк) и заполняет count / min_ts / max_ts
+    и blocks в манифесте.
+    """
+    directory = segments_dir(path)
+    src = os.path.join(directory, segment["name"])
+    dst = src + ".gz"
+    tmp = dst + ".tmp"
+    block_size = LOG_SEGMENT_BLOCK_KB * 1024
+    count, min_ts, max_ts = 0, None, None
+    blocks, chunk, pending, plain = [], [], 0, 0
+    with open(src, "rb") as fin, open(tmp, "wb") as out:
+        for line in fin:
+            chunk.append(line)
+            pending += len(line)
+            if pending >= block_size:
+                _write_block(out, chunk, blocks, plain)
+                chunk, pending, plain = [], 0, plain + pending
+            try:
+                record = msgspec.json.decode(line)
+            except msgspec.DecodeError:
+                continue
+            count += 1
+            ts = normalize_ts(record.get("timestamp")) if isinstance(record, dict) else None
+            if ts is not None:
+                min_ts = ts if min_ts is None or ts < min_ts else min_ts
+                max_ts = ts if max_ts is None or ts > max_ts else max_ts
+        if chunk:
+            _write_block(out, chunk, blocks, plain)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, dst)
+
+    with log_lock(path, exclusive=True):
+        manifest = load_manifest(path)
+        for s in manifest["segments"]:
+            if s["start"] == segment["start"]:
+                s.update(name=segment["name"] + ".gz", count=count, min_ts=min_ts, max_ts=max_ts,
+                         blocks=blocks)
+                segment = s
+        save_manifest(path, manifest)
+    # Читатель, успевший открыть несжатый файл, дочитает его по своему дескриптору
+    os.unlink(src)
+    return segment
+
+
+def drop_old_segments(path: str, retain: int) -> list:
+    """Удаляет всё, кроме retain последних сегментов. Курсоры в удалённые — с первого оставшегося."""
+    with log_lock(path, exclusive=True):
+        manifest = load_manifest(path)
+        dropped = manifest["segments"][:-retain]
+        if not dropped:
+            return []
+        manifest["segments"] = manifest["segments"][-retain:]
+        save_manifest(path, manifest)
+    for segment in dropped:
+        try:
+            os.unlink(os.path.join(segments_dir(path), segment["name"]))
+        except FileNotFoundError:
+            pass
+    return dropped
+
+
+def recover(path: str) -> None:
+    """Доводит до конца ротацию, прерванную падением процесса."""
+    directory = segments_dir(path)
+    if not os.path.isdir(directory):
+        return
+    # Ждём чужую ротацию: её .tmp ещё нужны
+    with rotation_lock(path):
+        _recover(path, directory)
+
+
+def _recover(path: str, directory: str) -> None:
+    with log_lock(path, exclusive=True):
+        manifest = load_manifest(path)
+        known = {s["name"] for s in manifest["segments"]}
+        changed = False
+        for name in sorted(os.listdir(directory)):
+            full = os.path.join(directory, name)
+            m = _SEGMENT_RE.fullmatch(name)
+            if name.endswith(".tmp") or name + ".gz" in known:
+                os.unlink(full)  # недописанный .gz / манифест или несжатая копия сжатого сегмента
+            elif m and name not in known and name[:-3] not in known:
+                if not m.group(2) and int(m.group(1)) >= manifest["next"]:
+                    # Переименовали, но не успели записать манифест
+                    _register(manifest, name, os.path.getsize(full))
+                    changed = True
+                else:
+                    os.unlink(full)  # остаток удалённого сегмента
+        if changed:
+            save_manifest(path, manifest)
+    for segment in manifest["segments"]:
+        if not segment["name"].endswith(".gz"):
+            compress_segment(path, segment)
+
+
+class RotatingLogWriter(FileLogWriter):
+    """FileLogWriter, который запечатывает активный файл по размеру или возрасту."""
+
+    def __init__(self, path: str, max_bytes: int = 0, max_age: float = 0, retain: int = 0):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retain = retain
+        self.rotations = 0
+        self._opened_at = None
+        self._recovered = False
+
+    @classmethod
+    def from_env(cls, path: str) -> "RotatingLogWriter":
+        return cls(
+            path,
+            max_bytes=int(LOG_ROTATE_MB * 1024 * 1024),
+            max_age=LOG_ROTATE_SECONDS,
+            retain=LOG_RETAIN_SEGMENTS,
+        )
+
+    def write_batch(self, batch: list) -> int:
+        if not self._recovered:
+            recover(self.path)
+            self._recovered = True
+        # Под разделяемым замком никто не переименует файл между проверкой и записью
+        with log_lock(self.path, exclusive=False):
+            if self._file is not None and self._replaced():
+                # Другой писатель запечатал файл — пишем в новый активный
+                self.close()
+                self._opened_at = None
+            written = super().write_batch(batch)
+        if self._opened_at is None:
+            self._opened_at = time.monotonic()
+        if self._due():
+            self.rotate()
+        return written
+
+    def _replaced(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _due(self) -> bool:
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.monotonic() - self._opened_at >= self.max_age
+
+    def rotate(self) -> None:
+        # Сжатие идёт в потоке записи LogSink: новые записи тем временем ждут в очереди
+        inode = None
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            inode = os.fstat(self._file.fileno()).st_ino
+        self.close()
+        self._opened_at = None
+        if seal(self.path, self.retain, inode) is not None:
+            self.rotations += 1
+
+
+def show(path: str) -> None:
+    manifest = load_manifest(path)
+    for s in manifest["segments"]:
+        print(f"{s['name']:<20} start={s['start']:<12} bytes={s['bytes']:<11} "
+              f"count={s['count']}  {s['min_ts']} .. {s['max_ts']}")
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    print(f"{os.path.basename(path):<20} start={manifest['active_start']:<12} bytes={size:<11} (активный)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сегменты логов identserver")
+    parser.add_argument("--logfile", default="logs.jsonl")
+    parser.add_argument("--seal", action="store_true",
+                        help="запечатать активный файл сейчас (только при остановленном identserver)")
+    args = parser.parse_args()
+    if args.seal:
+        recover(args.logfile)
+        seal(args.logfile, LOG_RETAIN_SEGMENTS)
+    show(args.logfile)
+
+
+if __name__ == "__main__":
+    main()
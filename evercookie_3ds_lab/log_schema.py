@@ -0,0 +1,80 @@
+"""
+Схема записи /log. Тело читается не больше LOG_MAX_BODY байт и
+разбирается msgspec сразу в типизированную структуру: лишние поля,
+чужие типы и слишком длинные строки отсекаются на декодировании,
+без промежуточного dict и без ручных проверок.
+"""
+import os
+from typing import Annotated, Literal, Optional
+
+import msgspec
+
+# Предел тела /log, байт (обычная запись — меньше килобайта)
+LOG_MAX_BODY = int(os.environ.get("LOG_MAX_BODY", "8192"))
+
+# UID, который выдаёт identserver, — 32 hex; в каналах бывает и короче
+UidStr = Annotated[str, msgspec.Meta(min_length=1, max_length=64)]
+ChannelValue = Optional[Annotated[str, msgspec.Meta(max_length=64)]]
+Millis = Optional[Annotated[float, msgspec.Meta(ge=0, le=600_000)]]
+
+
+class Channels(msgspec.Struct, forbid_unknown_fields=True):
+    cookie: ChannelValue = None
+    localStorage: ChannelValue = None
+    sessionStorage: ChannelValue = None
+    indexedDB: ChannelValue = None
+    pngCache: ChannelValue = None
+
+
+class ChannelTimings(msgspec.Struct, forbid_unknown_fields=True, omit_defaults=True):
+    cookie: Millis = None
+    localStorage: Millis = None
+    sessionStorage: Millis = None
+    indexedDB: Millis = None
+    pngCache: Millis = None
+
+
+class Timings(msgspec.Struct, forbid_unknown_fields=True, omit_defaults=True):
+    read: ChannelTimings = msgspec.field(default_factory=ChannelTimings)
+    write: ChannelTimings = msgspec.field(default_factory=ChannelTimings)
+    resolve: Millis = None
+    total: Millis = None
+
+
+class LogRecord(msgspec.Struct, forbid_unknown_fields=True, omit_defaults=True):
+    """То, что шлёт static/3ds-method.js, и ничего больше."""
+    uid: UidStr
+    mode: Literal["cross", "proxy"]
+    channels: Channels = msgspec.field(default_factory=Channels)
+    timings: Optional[Timings] = None
+    userAgent: Annotated[str, msgspec.Meta(max_length=512)] = ""
+    timestamp: Annotated[str, msgspec.Meta(max_length=40)] = ""
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+_decoder = msgspec.json.Decoder(LogRecord)
+
+
+async def read_body(request, limit: int = LOG_MAX_BODY) -> bytes:
+    """Тело запроса, но не больше limit байт: дальше не читаем."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        raise BodyTooLarge(f"body is {length} bytes, limit is {limit}")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise BodyTooLarge(f"body exceeds {limit} bytes")
+    return bytes(body)
+
+
+def decode_log_record(body: bytes) -> dict:
+    """
+    Проверенная запись в каноническом виде: поля в порядке схемы,
+    незаданные необязательные поля опущены.
+    Ошибка схемы или JSON — msgspec.ValidationError / msgspec.DecodeError.
+    """
+    return msgspec.to_builtins(_decoder.decode(body))
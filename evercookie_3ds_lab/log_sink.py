@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import os
+import time
+
+import msgspec
+
+# Политики fsync:
+#   none     — только flush() в ОС, fsync не делаем
+#   batch    — fsync после каждой записанной пачки
+#   interval — fsync не чаще, чем раз в fsync_interval секунд
+FSYNC_POLICIES = ("none", "batch", "interval")
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+def encode_record(record) -> bytes:
+    """
+    Компактная JSON-строка (без пробелов, UTF-8 как есть).
+    bytes — уже готовая строка (её присылают воркеры в лог-коллектор).
+    """
+    if isinstance(record, bytes):
+        return record
+    return msgspec.json.encode(record) + b"\n"
+
+
+class FileLogWriter:
+    """Дописывает пачки записей в JSONL через один открытый дескриптор."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def write_batch(self, batch: list) -> int:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        data = b"".join(encode_record(r) for r in batch)
+        self._file.write(data)
+        self._file.flush()
+        return len(data)
+
+    def sync(self) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            # Сначала забываем файл: если close() упадёт на flush, следующая пачка откроет его заново
+            f, self._file = self._file, None
+            f.close()
+
+
+class LogSink:
+    """
+    Group-commit запись логов: обработчики кладут записи в asyncio-очередь,
+    одна фоновая задача сбрасывает их пачками (по размеру или по времени)
+    через writer (файл, SQLite — см. storage.py). Сама запись идёт
+    в потоке, чтобы не блокировать event loop.
+
+    Пачку, которую writer не смог записать, не повторяем (часть её могла
+    уже лечь в файл): считаем её записи в lost, пишем ошибку в лог
+    и last_error и закрываем writer — следующая пачка откроет его заново.
+    """
+
+    def __init__(
+        self,
+        writer,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        fsync: str = "batch",
+        fsync_interval: float = 1.0,
+        queue_size: int = 100_000,
+        on_written=None,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy: {fsync!r}")
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.queue_size = queue_size
+        # on_written(batch) — после успешной записи пачки, в потоке event loop
+        self.on_written = on_written
+
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self._last_fsync = 0.0
+
+        self.records_written = 0
+        self.bytes_written = 0
+        self.batches = 0
+        self.errors = 0
+        self.lost = 0
+        self.last_error = None
+        self.dropped = 0
+        self.queue_high_watermark = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @classmethod
+    def from_env(cls, writer) -> "LogSink":
+        return cls(
+            writer,
+            batch_size=int(os.environ.get("LOG_BATCH_SIZE", "500")),
+            flush_interval=float(os.environ.get("LOG_FLUSH_MS", "50")) / 1000,
+            fsync=os.environ.get("LOG_FSYNC", "batch"),
+            fsync_interval=float(os.environ.get("LOG_FSYNC_INTERVAL", "1.0")),
+            queue_size=int(os.environ.get("LOG_QUEUE_SIZE", "100000")),
+        )
+
+    # Жизненный цикл
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает всё, что осталось в очереди, и закрывает writer."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        self._close()
+
+    # Запись
+
+    async def put(self, record) -> None:
+        if not self.running:
+            # Воркер не запущен (скрипт, тест без lifespan) — пишем сразу
+            self._write_batch([record])
+            return
+        await self._queue.put(record)
+        depth = self._queue.qsize()
+        if depth > self.queue_high_watermark:
+            self.queue_high_watermark = depth
+
+    def put_nowait(self, record) -> None:
+        """
+        Неблокирующая запись из любого потока: если очередь полна,
+        запись отбрасывается (учитывается в dropped).
+        """
+        if not self.running:
+            self._write_batch([record])
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._enqueue(record)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, record)
+
+    def _enqueue(self, record) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if await asyncio.to_thread(self._write_now, batch) and self.on_written is not None:
+                self.on_written(batch)
+
+    def _write_batch(self, batch: list) -> None:
+        if self._write_now(batch) and self.on_written is not None:
+            self.on_written(batch)
+
+    def _write_now(self, batch: list) -> bool:
+        started = time.perf_counter()
+        try:
+            written = self.writer.write_batch(batch)
+            self._maybe_fsync()
+        except Exception as e:
+            self.errors += 1
+            self.lost += len(batch)
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error("log batch lost: %d records, %s", len(batch), self.last_error)
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+            return False
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.records_written += len(batch)
+        self.bytes_written += written
+        self.batches += 1
+        self.last_flush_ms = elapsed
+        self.total_flush_ms += elapsed
+        if elapsed > self.max_flush_ms:
+            self.max_flush_ms = elapsed
+        return True
+
+    def _maybe_fsync(self) -> None:
+        if self.fsync == "batch":
+            self.writer.sync()
+        elif self.fsync == "interval":
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                self.writer.sync()
+                self._last_fsync = now
+
+    def _close(self) -> None:
+        if self.fsync != "none":
+            self.writer.sync()
+        self.writer.close()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_high_watermark": self.queue_high_watermark,
+            "records_written": self.records_written,
+            "bytes_written": self.bytes_written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "lost": self.lost,
+            "last_error": self.last_error,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 3) if self.batches else 0.0,
+            "fsync": self.fsync,
+        }
@@ -0,0 +1,69 @@
+import asyncio
+import itertools
+import os
+from collections import deque
+
+import msgspec
+
+# Сколько последних записей /log держим в памяти для /logs/stream
+LOG_TAIL_SIZE = int(os.environ.get("LOG_TAIL_SIZE", "1000"))
+
+# Раз в сколько секунд слать комментарий-пинг в тихий поток (не дать прокси закрыть соединение)
+LOG_TAIL_PING_S = float(os.environ.get("LOG_TAIL_PING_S", "15"))
+
+# Сколько секунд живёт одно подключение /logs/stream. Потом сервер закрывает
+# его, и EventSource переподключается с Last-Event-ID. Иначе открытый поток
+# не даёт uvicorn остановиться и lifespan не дописывает очередь логов
+LOG_TAIL_STREAM_S = float(os.environ.get("LOG_TAIL_STREAM_S", "30"))
+
+
+class LogTail:
+    """
+    Кольцевой буфер последних записей /log с порядковыми номерами (seq).
+    Подписчики /logs/stream читают из него, а не из файла. Записи попадают
+    сюда сразу после того, как LogSink записал их пачку (extend — его
+    on_written): всё, что в буфере до seq, уже есть и в /logs. Номера идут
+    с 1 и только растут; после перезапуска процесса счёт начинается заново.
+    """
+
+    def __init__(self, size: int = LOG_TAIL_SIZE):
+        self.seq = 0
+        self.subscribers = 0
+        self._buf = deque(maxlen=size)  # (seq, record, JSON-строка записи)
+        self._waiter = None
+
+    def append(self, record: dict) -> int:
+        self.seq += 1
+        self._buf.append((self.seq, record, msgspec.json.encode(record).decode()))
+        if self._waiter is not None:
+            self._waiter.set_result(None)
+            self._waiter = None
+        return self.seq
+
+    def extend(self, records: list) -> None:
+        for record in records:
+            self.append(record)
+
+    def since(self, after: int) -> tuple:
+        """
+        Записи с seq > after и сколько записей между after и буфером
+        уже вытеснено.
+        """
+        if not self._buf:
+            return [], 0
+        first = self._buf[0][0]
+        missed = max(0, first - after - 1)
+        start = max(0, after - first + 1)
+        return list(itertools.islice(self._buf, start, None)), missed
+
+    async def wait(self, after: int, timeout: float) -> bool:
+        """Ждёт записи новее after не дольше timeout. False — не дождались."""
+        if self.seq > after:
+            return True
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waiter), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
@@ -0,0 +1,161 @@
+import bisect
+import threading
+import time
+
+from fastapi.responses import PlainTextResponse
+
+# Границы корзин латентности, секунды
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """
+    Минимальный реестр метрик в текстовом формате Prometheus:
+    счётчики, гистограммы и gauge, значения которых читаются при выдаче.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = []
+        self.in_flight = 0
+
+    def _declare(self, name: str, kind: str, help_text: str) -> None:
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = help_text
+
+    def inc(self, name: str, labels: dict = None, value: float = 1, help_text: str = "") -> None:
+        key = (name, tuple((labels or {}).items()))
+        with self._lock:
+            self._declare(name, "counter", help_text)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: dict, seconds: float, help_text: str = "") -> None:
+        key = (name, tuple((labels or {}).items()))
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram()
+            hist.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            hist.total += seconds
+            hist.count += 1
+
+    def gauge(self, name: str, read, help_text: str = "", kind: str = "gauge") -> None:
+        """
+        Значение, которое берётся из приложения в момент выдачи /metrics.
+        read() возвращает число или словарь {tuple(пар меток): число}.
+        """
+        self._declare(name, kind, help_text)
+        self._gauges.append((name, read))
+
+    def render(self) -> str:
+        lines = []
+        by_name = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                by_name.setdefault(name, []).append(f"{name}{_labels(dict(labels))} {value}")
+            for (name, labels), hist in self._histograms.items():
+                rows = by_name.setdefault(name, [])
+                labels = dict(labels)
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, hist.counts):
+                    cumulative += n
+                    rows.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+                rows.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {hist.count}")
+                rows.append(f"{name}_sum{_labels(labels)} {hist.total}")
+                rows.append(f"{name}_count{_labels(labels)} {hist.count}")
+            by_name.setdefault("http_requests_in_flight", []).append(
+                f"http_requests_in_flight {self.in_flight}")
+            self._declare("http_requests_in_flight", "gauge", "Запросы в обработке")
+
+        for name, read in self._gauges:
+            value = read()
+            rows = by_name.setdefault(name, [])
+            if isinstance(value, dict):
+                for labels, v in value.items():
+                    rows.append(f"{name}{_labels(dict(labels))} {v}")
+            else:
+                rows.append(f"{name} {value}")
+
+        for name in sorted(by_name):
+            if self._help.get(name):
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {self._types.get(name, 'untyped')}")
+            lines.extend(by_name[name])
+        return "\n".join(lines) + "\n"
+
+    def response(self) -> PlainTextResponse:
+        return PlainTextResponse(self.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: число запросов по маршруту/методу/статусу,
+    запросы в обработке и гистограмма латентности по маршруту.
+    Маршрут — шаблон пути (/static/{name}), а не сырой URL.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            metrics.inc(
+                "http_requests_total",
+                {"method": scope["method"], "route": path, "status": status},
+                help_text="HTTP-запросы по маршруту и статусу",
+            )
+            metrics.observe(
+                "http_request_duration_seconds",
+                {"route": path},
+                elapsed,
+                help_text="Латентность обработки запроса по маршруту",
+            )
@@ -0,0 +1,176 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return ";".join(stack)
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профайлер: отдельный поток раз в interval секунд снимает
+    стек потоков, в которых сейчас идёт профилируемый запрос, и копит
+    их в collapsed-stack виде (формат flamegraph.pl / speedscope)
+    за скользящее окно window секунд.
+
+    Запросы identserver/domain1 в основном async и идут в потоке event loop,
+    поэтому в профиль попадает всё, что loop делал, пока такой запрос
+    был в обработке, — в том числе соседние запросы.
+    """
+
+    def __init__(self, interval: float = 0.005, window: float = 300.0):
+        self.interval = interval
+        self.window = window
+        self._lock = threading.Lock()
+        self._active = Counter()  # thread id -> профилируемых запросов в полёте
+        self._wakeup = threading.Event()
+        self._buckets = deque()  # (секунда, Counter стеков)
+        self._thread = None
+        self.samples = 0
+        self.profiled_requests = 0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def begin(self) -> int:
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] += 1
+            self.profiled_requests += 1
+        self._ensure_thread()
+        self._wakeup.set()
+        return thread_id
+
+    def end(self, thread_id: int) -> None:
+        with self._lock:
+            self._active[thread_id] -= 1
+            if self._active[thread_id] <= 0:
+                del self._active[thread_id]
+            if not self._active:
+                self._wakeup.clear()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                targets = [tid for tid in self._active if tid != own]
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            stacks = [_collapse(frames[tid]) for tid in targets if tid in frames]
+            self._record(stacks)
+
+    def _record(self, stacks: list) -> None:
+        now = int(time.monotonic())
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != now:
+                self._buckets.append((now, Counter()))
+            bucket = self._buckets[-1][1]
+            for stack in stacks:
+                bucket[stack] += 1
+            self.samples += len(stacks)
+            while self._buckets and self._buckets[0][0] < now - self.window:
+                self._buckets.popleft()
+
+    def collapsed(self) -> str:
+        """Стеки за окно: «frame;frame;frame count» по строке на стек."""
+        total = Counter()
+        with self._lock:
+            for _, bucket in self._buckets:
+                total.update(bucket)
+        return "".join(f"{stack} {n}\n" for stack, n in total.most_common())
+
+
+class ProfilerMiddleware:
+    """
+    Решает, профилировать ли запрос: случайная доля sample_rate
+    или заголовок X-Profile: 1 (с X-Profile-Token, если задан токен).
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler, sample_rate: float, token: str):
+        self.app = app
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.token = token.encode() if token else None
+
+    def _wanted(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") != b"1":
+            return False
+        return self.token is None or headers.get(b"x-profile-token") == self.token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        thread_id = self.profiler.begin()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.end(thread_id)
+
+
+def install_profiler(app) -> SamplingProfiler:
+    """
+    Включает профайлер, только если PROFILER_ENABLED=1: без него
+    нет ни middleware, ни потока, ни /debug/profile.
+
+      PROFILE_SAMPLE_RATE   доля случайно профилируемых запросов (0.0)
+      PROFILE_INTERVAL_MS   период снятия стеков (5)
+      PROFILE_WINDOW_S      окно агрегации (300)
+      PROFILER_TOKEN        если задан — нужен в X-Profile-Token (и для X-Profile,
+                            и для скачивания); если нет — скачивать можно только с localhost
+    """
+    if os.environ.get("PROFILER_ENABLED") != "1":
+        return None
+
+    profiler = SamplingProfiler(
+        interval=float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000,
+        window=float(os.environ.get("PROFILE_WINDOW_S", "300")),
+    )
+    token = os.environ.get("PROFILER_TOKEN", "")
+    app.add_middleware(
+        ProfilerMiddleware,
+        profiler=profiler,
+        sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+        token=token,
+    )
+
+    @app.get("/debug/profile", include_in_schema=False)
+    async def download_profile(request: Request):
+        if token:
+            allowed = request.headers.get("x-profile-token") == token
+        else:
+            allowed = request.client is not None and request.client.host in ("127.0.0.1", "::1")
+        if not allowed:
+            return PlainTextResponse("forbidden\n", status_code=403)
+        resp = PlainTextResponse(profiler.collapsed())
+        resp.headers["X-Profile-Samples"] = str(profiler.samples)
+        resp.headers["X-Profiled-Requests"] = str(profiler.profiled_requests)
+        resp.headers["Content-Disposition"] = 'attachment; filename="profile.collapsed"'
+        return resp
+
+    return profiler
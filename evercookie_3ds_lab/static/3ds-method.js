@@ -0,0 +1,199 @@
+// Общий скрипт 3DS Method для обоих стендов.
+// Настройки берём из data-атрибутов тега <script>:
+//   data-mode          — "cross" или "proxy"
+//   data-png           — адрес PNG-кэша (/cache.png или /proxy-cache.png)
+//   data-log           — куда слать лог (/log на identserver)
+//   data-cookie-attrs  — атрибуты cookie device_id
+//   data-read-timeout  — сколько мс ждать один канал (по умолчанию 2000)
+(function () {
+const config = document.currentScript.dataset;
+const MODE = config.mode;
+const PNG_ENDPOINT = config.png;
+const LOG_ENDPOINT = config.log;
+const COOKIE_ATTRS = config.cookieAttrs || "path=/";
+const READ_TIMEOUT_MS = Number(config.readTimeout) || 2000;
+
+// --- helpers ---
+// Результат промиса, но не дольше ms; по таймауту или ошибке — fallback
+function withTimeout(promise, ms, fallback) {
+    return new Promise((resolve) => {
+        const timer = setTimeout(() => resolve(fallback), ms);
+        promise.then(
+            (v) => { clearTimeout(timer); resolve(v); },
+            () => { clearTimeout(timer); resolve(fallback); }
+        );
+    });
+}
+
+// Синхронная операция с каналом как промис; исключение -> null
+function attempt(fn) {
+    try { return Promise.resolve(fn()); } catch(e) { return Promise.resolve(null); }
+}
+
+// Время каждого шага в мс (performance.now) — уходит в лог как timings
+const timings = { read: {}, write: {} };
+
+function round2(ms) { return Math.round(ms * 100) / 100; }
+
+function timed(group, name, promise) {
+    const start = performance.now();
+    return promise.then((v) => {
+        timings[group][name] = round2(performance.now() - start);
+        return v;
+    });
+}
+
+// Лог уходит через sendBeacon (text/plain — без CORS preflight),
+// если его нет — обычный fetch с keepalive
+function sendLog(payload) {
+    const body = JSON.stringify(payload);
+    try {
+        if (navigator.sendBeacon &&
+            navigator.sendBeacon(LOG_ENDPOINT, new Blob([body], {type: "text/plain"}))) {
+            return;
+        }
+    } catch(e) {}
+    fetch(LOG_ENDPOINT, {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body,
+        keepalive: true
+    }).catch(()=>{});
+}
+
+// --- IndexedDB helpers ---
+function idb_get(dbName, storeName, key) {
+    return new Promise((resolve) => {
+        const req = indexedDB.open(dbName, 1);
+        req.onupgradeneeded = () => {
+            let db = req.result;
+            db.createObjectStore(storeName);
+        };
+        req.onsuccess = () => {
+            let db = req.result;
+            const tx = db.transaction(storeName, "readonly");
+            const store = tx.objectStore(storeName);
+            const r = store.get(key);
+            r.onsuccess = () => resolve(r.result || null);
+            r.onerror = () => resolve(null);
+        };
+        req.onerror = () => resolve(null);
+    });
+}
+
+function idb_set(dbName, storeName, key, value) {
+    return new Promise((resolve) => {
+        const req = indexedDB.open(dbName, 1);
+        req.onupgradeneeded = () => {
+            let db = req.result;
+            db.createObjectStore(storeName);
+        };
+        req.onsuccess = () => {
+            let db = req.result;
+            const tx = db.transaction(storeName, "readwrite");
+            const store = tx.objectStore(storeName);
+            store.put(value, key);
+            tx.oncomplete = () => resolve(true);
+            tx.onerror = () => resolve(false);
+        };
+        req.onerror = () => resolve(false);
+    });
+}
+
+// --- PNG cache ---
+class PNGCache {
+    constructor(endpoint) {
+        this.endpoint = endpoint;
+        this.canvasWidth = 200;
+    }
+    loadUID() {
+        return new Promise((resolve) => {
+            const img = new Image();
+            img.crossOrigin = "anonymous";
+            img.onload = () => {
+                const canvas = document.createElement("canvas");
+                canvas.width = this.canvasWidth;
+                canvas.height = 1;
+                const ctx = canvas.getContext("2d");
+                ctx.drawImage(img, 0, 0);
+                const pix = ctx.getImageData(0, 0, this.canvasWidth, 1).data;
+                let uid = "";
+                for (let i = 0; i < pix.length; i += 4) {
+                    const r = pix[i], g = pix[i+1], b = pix[i+2];
+                    if (r === 0 && g === 0 && b === 0) break;
+                    uid += String.fromCharCode(r);
+                    if (g !== 0) uid += String.fromCharCode(g);
+                    if (b !== 0) uid += String.fromCharCode(b);
+                }
+                resolve(uid || null);
+            };
+            img.onerror = () => resolve(null);
+            img.src = this.endpoint;
+        });
+    }
+}
+
+// --- main ---
+(async () => {
+    const started = performance.now();
+
+    // Все каналы читаем одновременно, каждый со своим таймаутом
+    const png = new PNGCache(PNG_ENDPOINT);
+    const [cookieVal, lsVal, ssVal, idbVal, pngVal] = await Promise.all([
+        timed("read", "cookie", attempt(() => {
+            const m = document.cookie.match(/device_id=([^;]+)/);
+            return m ? m[1] : null;
+        })),
+        timed("read", "localStorage", attempt(() => localStorage.getItem("device_id"))),
+        timed("read", "sessionStorage", attempt(() => sessionStorage.getItem("device_id"))),
+        timed("read", "indexedDB",
+            withTimeout(idb_get("evercookieDB","store","device_id"), READ_TIMEOUT_MS, null)),
+        timed("read", "pngCache", withTimeout(png.loadUID(), READ_TIMEOUT_MS, null))
+    ]);
+
+    const candidates = [cookieVal, lsVal, ssVal, idbVal, pngVal].filter(Boolean);
+    let finalUID = candidates.length > 0 ? candidates[0] : null;
+    if (!finalUID) {
+        // PNG-значение предпочтительнее, если оно есть
+        finalUID = pngVal || Math.random().toString(16).slice(2, 18);
+    }
+
+    const channels = {
+        cookie: cookieVal,
+        localStorage: lsVal,
+        sessionStorage: ssVal,
+        indexedDB: idbVal,
+        pngCache: pngVal
+    };
+
+    // postMessage родителю — сразу, как только UID определён
+    window.parent.postMessage({
+        type: "DEVICE_ID",
+        id: finalUID,
+        mode: MODE,
+        channels
+    }, "*");
+    timings.resolve = round2(performance.now() - started);
+
+    // Дальше — вне критического пути: запись во все каналы и лог
+    await Promise.all([
+        timed("write", "cookie", attempt(() => {
+            document.cookie = "device_id=" + finalUID + "; " + COOKIE_ATTRS;
+        })),
+        timed("write", "localStorage", attempt(() => localStorage.setItem("device_id", finalUID))),
+        timed("write", "sessionStorage", attempt(() => sessionStorage.setItem("device_id", finalUID))),
+        timed("write", "indexedDB",
+            withTimeout(idb_set("evercookieDB","store","device_id", finalUID), READ_TIMEOUT_MS, false))
+    ]);
+    timings.total = round2(performance.now() - started);
+
+    sendLog({
+        uid: finalUID,
+        mode: MODE,
+        channels,
+        timings,
+        userAgent: navigator.userAgent,
+        timestamp: new Date().toISOString()
+    });
+})();
+})();
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import os
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli есть в зависимостях (README); без него отдаём только gzip
+    brotli = None
+
+
+def _accepted_encodings(header: str) -> set:
+    """Кодировки из Accept-Encoding с q > 0."""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(name)
+    return accepted
+
+
+def _gzip(body: bytes) -> bytes:
+    return gzip.compress(body, 9, mtime=0)
+
+
+# content-coding -> (суффикс ETag, функция сжатия)
+_ENCODINGS = {"gzip": ("-gz", _gzip)}
+if brotli is not None:
+    _ENCODINGS["br"] = ("-br", brotli.compress)
+
+
+class StaticPage:
+    """
+    Страница, собранная один раз: готовые байты + gzip/brotli-варианты
+    и сильные ETag для каждого варианта. На запрос — только выбор
+    варианта по Accept-Encoding или 304 по If-None-Match.
+    Все варианты сжимаются здесь же, при создании страницы; когда
+    создавать её — на импорте или при первом запросе, решает LazyPage.
+    """
+
+    def __init__(self, content: str, media_type: str = "text/html; charset=utf-8",
+                 cache_control: str = "no-cache"):
+        self.media_type = media_type
+        self.cache_control = cache_control
+
+        body = content.encode("utf-8")
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        # encoding -> тело; у разных content-coding разные сильные ETag
+        self._bodies = {None: body}
+        self._etags = {None: f'"{self.digest}"'}
+        for encoding, (suffix, compress) in _ENCODINGS.items():
+            self._bodies[encoding] = compress(body)
+            self._etags[encoding] = f'"{self.digest}{suffix}"'
+        self.etags = set(self._etags.values())
+
+    def variant(self, encoding) -> tuple:
+        """(тело, ETag) для content-coding (None — без сжатия)."""
+        return self._bodies[encoding], self._etags[encoding]
+
+    def _negotiate(self, accept_encoding: str):
+        if not accept_encoding:
+            return None
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self._etags and (encoding in accepted or "*" in accepted):
+                return encoding
+        return None
+
+    def _not_modified(self, if_none_match: str) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return bool(tags & self.etags)
+
+    def response(self, request: Request) -> Response:
+        encoding = self._negotiate(request.headers.get("accept-encoding", ""))
+        etag = self._etags[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self._not_modified(request.headers.get("if-none-match", "")):
+            return Response(status_code=304, headers=headers)
+        body, _ = self.variant(encoding)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+class LazyPage:
+    """
+    StaticPage, которая рендерится и сжимается при первом запросе, а не
+    на импорте: шаблоны и brotli не замедляют холодный старт. Первый
+    запрос к странице платит за все её варианты сразу.
+    """
+
+    def __init__(self, render, **kwargs):
+        self.render = render
+        self.kwargs = kwargs
+        self._page = None
+
+    @property
+    def page(self) -> StaticPage:
+        if self._page is None:
+            self._page = StaticPage(self.render(), **self.kwargs)
+        return self._page
+
+    def response(self, request: Request) -> Response:
+        return self.page.response(request)
+
+
+class HashedAsset(StaticPage):
+    """
+    Статический файл с хэшем содержимого в имени (3ds-method.<hash>.js).
+    Имя меняется вместе с содержимым, поэтому кэшируем навсегда.
+    """
+
+    def __init__(self, path: str, media_type: str):
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        super().__init__(content, media_type, cache_control="public, max-age=31536000, immutable")
+        stem, ext = os.path.splitext(os.path.basename(path))
+        self.name = f"{stem}.{self.digest[:12]}{ext}"
+        self.url = f"/static/{self.name}"
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# Общий скрипт 3DS Method: его отдают и identserver (cross), и domain1 (proxy)
+three_ds_method_js = HashedAsset(
+    os.path.join(STATIC_DIR, "3ds-method.js"),
+    "application/javascript; charset=utf-8",
+)
+STATIC_ASSETS = {three_ds_method_js.name: three_ds_method_js}
@@ -0,0 +1,494 @@
+"""
+Хранилища identserver: логи /log и результаты автотестов.
+
+  file   — как раньше: logs.jsonl + test_results.json
+  sqlite — одна база SQLite в режиме WAL с индексами по uid/mode/timestamp/browser
+
+Выбор — переменная окружения STORAGE_BACKEND (file | sqlite), путь к базе —
+SQLITE_PATH. Перенос истории из файлов в базу:
+
+    python storage.py import --db lab.sqlite3 --logs logs.jsonl --results test_results.json
+"""
+import argparse
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from log_reader import LogFilter, LogQuery, browser_family, normalize_ts
+from log_rotation import RotatingLogWriter
+from log_sink import encode_record
+
+
+class TestResultsFile:
+    """
+    Результаты автотестов в файлах, безопасно для нескольких процессов.
+
+      test_results.json          — снапшот (обычный JSON-массив, как раньше)
+      test_results.json.journal  — append-only журнал: по JSON-записи на строку
+      test_results.json.lock     — flock: запись/компакция эксклюзивно, чтение разделяемо
+
+    Запись — одна строка в журнал, O(1). Компакция переносит журнал
+    в снапшот через временный файл + os.replace. В памяти держится
+    материализованное представление; перечитывается только то,
+    что дописали другие процессы.
+    """
+
+    __test__ = False  # не путать pytest префиксом Test
+
+    def __init__(self, path: str, compact_every: int = 1000):
+        self.path = path
+        self.journal = path + ".journal"
+        self.lockfile = path + ".lock"
+        self.compact_every = compact_every
+
+        self._mutex = threading.Lock()
+        self._records = []
+        self._snapshot_key = None
+        self._journal_key = None
+        self._journal_offset = 0
+        self._journal_count = 0
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with open(self.lockfile, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_key(path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    # Чтение
+
+    def _load_snapshot(self) -> list:
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            return []
+        return data if isinstance(data, list) else []
+
+    @staticmethod
+    def _read_journal(path: str, offset: int = 0) -> tuple:
+        """Записи журнала с offset; недописанная строка в конце пропускается."""
+        records = []
+        if not os.path.exists(path):
+            return records, offset
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+        return records, offset
+
+    def _refresh(self) -> None:
+        """Догоняет файлы на диске. Вызывать под self._mutex и flock."""
+        snapshot_key = self._file_key(self.path)
+        journal_key = self._file_key(self.journal)
+        journal_ino = journal_key[0] if journal_key else None
+        known_ino = self._journal_key[0] if self._journal_key else None
+
+        if (
+            snapshot_key != self._snapshot_key
+            or journal_ino != known_ino
+            or (journal_key and journal_key[2] < self._journal_offset)
+        ):
+            # Снапшот переписали (компакция) или журнал подменили — читаем заново
+            self._records = self._load_snapshot()
+            tail, self._journal_offset = self._read_journal(self.journal)
+            self._records.extend(tail)
+            self._journal_count = len(tail)
+        elif journal_key != self._journal_key:
+            tail, self._journal_offset = self._read_journal(self.journal, self._journal_offset)
+            self._records.extend(tail)
+            self._journal_count += len(tail)
+
+        self._snapshot_key = snapshot_key
+        self._journal_key = journal_key
+
+    def records(self) -> list:
+        with self._mutex:
+            if os.path.exists(self.journal + ".compacting"):
+                with self._locked(exclusive=True):
+                    self._recover()
+            with self._locked(exclusive=False):
+                self._refresh()
+                return list(self._records)
+
+    # Запись
+
+    def append(self, record) -> None:
+        self.append_many([record])
+
+    def append_many(self, records: list) -> None:
+        """Пачка записей — одна запись в журнал и один fsync."""
+        if not records:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        with self._mutex, self._locked(exclusive=True):
+            self._recover()
+            self._refresh()
+            if self._journal_key and self._journal_key[2] > self._journal_offset:
+                # Хвост без \n — обрывок от упавшего процесса: иначе он склеится
+                # с нашей первой строкой, и её не прочитать
+                os.truncate(self.journal, self._journal_offset)
+            with open(self.journal, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+            if self.compact_every and self._journal_count >= self.compact_every:
+                self._compact()
+
+    def compact(self) -> None:
+        with self._mutex, self._locked(exclusive=True):
+            self._recover()
+            self._refresh()
+            self._compact()
+
+    def _compact(self) -> None:
+        """Переносит журнал в снапшот. Вызывать под эксклюзивным flock."""
+        if not self._journal_count:
+            return
+        pending = self.journal + ".compacting"
+        os.replace(self.journal, pending)
+        self._write_snapshot(self._records)
+        os.unlink(pending)
+        self._refresh()
+
+    def _write_snapshot(self, records: list) -> None:
+        tmp = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _recover(self) -> None:
+        """
+        Доводит до конца компакцию, прерванную падением процесса:
+        если хвост снапшота уже совпадает с журналом — он был применён.
+        """
+        pending = self.journal + ".compacting"
+        if not os.path.exists(pending):
+            return
+        tail, _ = self._read_journal(pending)
+        snapshot = self._load_snapshot()
+        if tail and snapshot[-len(tail):] != tail:
+            self._write_snapshot(snapshot + tail)
+        os.unlink(pending)
+
+
+class FileStorage:
+    def __init__(self, logfile: str, test_results_file: str):
+        self.logfile = logfile
+        self.test_results_file = test_results_file
+        self._test_results = TestResultsFile(
+            test_results_file,
+            compact_every=int(os.environ.get("TEST_RESULTS_COMPACT_EVERY", "1000")),
+        )
+
+    # Логи
+
+    def log_writer(self) -> RotatingLogWriter:
+        # Ротация в сжатые сегменты по LOG_ROTATE_MB / LOG_ROTATE_SECONDS (см. log_rotation.py)
+        return RotatingLogWriter.from_env(self.logfile)
+
+    def query_logs(self, after: int = 0, limit: Optional[int] = None, flt: Optional[LogFilter] = None,
+                   order: str = "asc", before: Optional[int] = None):
+        return LogQuery(self.logfile, after, limit, flt, order, before)
+
+    # Результаты автотестов
+
+    def append_test_results(self, records: list) -> None:
+        self._test_results.append_many(records)
+
+    def test_results(self) -> list:
+        return self._test_results.records()
+
+
+# ---------- SQLite ----------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id         INTEGER PRIMARY KEY,
+    uid        TEXT,
+    mode       TEXT,
+    ts         TEXT,
+    browser    TEXT,
+    user_agent TEXT,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_uid ON logs(uid);
+CREATE INDEX IF NOT EXISTS logs_mode ON logs(mode);
+CREATE INDEX IF NOT EXISTS logs_ts ON logs(ts);
+CREATE INDEX IF NOT EXISTS logs_browser ON logs(browser);
+
+CREATE TABLE IF NOT EXISTS test_results (
+    id      INTEGER PRIMARY KEY,
+    browser TEXT,
+    stand   TEXT,
+    data    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS test_results_browser ON test_results(browser);
+"""
+
+# Запросы — константные строки: sqlite3 кэширует скомпилированные
+# выражения на соединение, так что повторные вызовы не парсят SQL заново.
+INSERT_LOG = (
+    "INSERT INTO logs (uid, mode, ts, browser, user_agent, data) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+INSERT_TEST_RESULT = "INSERT INTO test_results (browser, stand, data) VALUES (?, ?, ?)"
+SELECT_TEST_RESULTS = "SELECT data FROM test_results ORDER BY id"
+
+
+def _str_or_none(value) -> Optional[str]:
+    return value if isinstance(value, str) else None
+
+
+def _log_row(record) -> tuple:
+    if isinstance(record, bytes):
+        # Готовая строка JSONL от лог-коллектора (см. log_collector.py)
+        data = record.rstrip(b"\n").decode("utf-8")
+        record = json.loads(data)
+    else:
+        data = encode_record(record)[:-1].decode("utf-8")
+    if not isinstance(record, dict):
+        record = {"value": record}
+    agent = _str_or_none(record.get("userAgent"))
+    return (
+        _str_or_none(record.get("uid")),
+        _str_or_none(record.get("mode")),
+        normalize_ts(record.get("timestamp")),
+        browser_family(agent),
+        agent,
+        data,
+    )
+
+
+def _test_result_row(record) -> tuple:
+    if not isinstance(record, dict):
+        record = {"value": record}
+    return (
+        _str_or_none(record.get("browser")),
+        _str_or_none(record.get("stand")),
+        json.dumps(record, ensure_ascii=False),
+    )
+
+
+class SqliteLogWriter:
+    """Writer для LogSink: пачка записей — один executemany в одной транзакции."""
+
+    def __init__(self, storage: "SqliteStorage"):
+        self.storage = storage
+
+    def write_batch(self, batch: list) -> int:
+        rows = [_log_row(r) for r in batch]
+        self.storage.insert_many(INSERT_LOG, rows)
+        return sum(len(row[-1]) + 1 for row in rows)
+
+    def sync(self) -> None:
+        # synchronous=NORMAL в WAL: fsync делает сам SQLite на чекпоинтах
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteLogQuery:
+    """
+    То же, что LogQuery, но по таблице logs. Курсор — id последней
+    выданной записи (?after=<id>, для order="desc" — ?before=<id>).
+    """
+
+    def __init__(self, storage: "SqliteStorage", after: int = 0, limit: Optional[int] = None,
+                 flt: Optional[LogFilter] = None, order: str = "asc", before: Optional[int] = None):
+        self.storage = storage
+        self.after = after
+        self.before = before
+        self.limit = limit
+        self.flt = flt or LogFilter()
+        self.order = order
+        self.cursor = after if order == "asc" else (before or 0)
+        self.has_more = False
+
+    def _sql(self) -> tuple:
+        flt = self.flt
+        if self.order == "desc":
+            where = ["id < ?"] if self.before is not None else ["1"]
+            args = [self.before] if self.before is not None else []
+        else:
+            where = ["id > ?"]
+            args = [self.after]
+        if flt.mode is not None:
+            where.append("mode = ?")
+            args.append(flt.mode)
+        if flt.uid is not None:
+            where.append("uid = ?")
+            args.append(flt.uid)
+        if flt.since is not None:
+            where.append("ts >= ?")
+            args.append(normalize_ts(flt.since.isoformat()))
+        if flt.until is not None:
+            where.append("ts <= ?")
+            args.append(normalize_ts(flt.until.isoformat()))
+        if flt.ua is not None:
+            where.append("instr(lower(user_agent), ?) > 0")
+            args.append(flt.ua)
+        sql = "SELECT id, data FROM logs WHERE " + " AND ".join(where) + " ORDER BY id"
+        if self.order == "desc":
+            sql += " DESC"
+        if self.limit is not None:
+            sql += " LIMIT ?"
+            args.append(self.limit + 1)
+        return sql, args
+
+    def __iter__(self) -> Iterator[dict]:
+        sql, args = self._sql()
+        conn = self.storage.reader()
+        try:
+            count = 0
+            for row_id, data in conn.execute(sql, args):
+                if self.limit is not None and count >= self.limit:
+                    self.has_more = True
+                    return
+                self.cursor = row_id
+                count += 1
+                yield json.loads(data)
+        finally:
+            conn.close()
+
+
+class SqliteStorage:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """Отдельное соединение на чтение: в WAL читатели не ждут писателя."""
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def insert_many(self, sql: str, rows: list) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    # Логи
+
+    def log_writer(self) -> SqliteLogWriter:
+        return SqliteLogWriter(self)
+
+    def query_logs(self, after: int = 0, limit: Optional[int] = None, flt: Optional[LogFilter] = None,
+                   order: str = "asc", before: Optional[int] = None):
+        return SqliteLogQuery(self, after, limit, flt, order, before)
+
+    # Результаты автотестов
+
+    def append_test_results(self, records: list) -> None:
+        self.insert_many(INSERT_TEST_RESULT, [_test_result_row(r) for r in records])
+
+    def test_results(self) -> list:
+        conn = self.reader()
+        try:
+            return [json.loads(data) for (data,) in conn.execute(SELECT_TEST_RESULTS)]
+        finally:
+            conn.close()
+
+    # Импорт истории из файлов
+
+    def has_rows(self, table: str) -> bool:
+        conn = self.reader()
+        try:
+            return conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None
+        finally:
+            conn.close()
+
+    def import_files(self, logfile: Optional[str] = None, test_results_file: Optional[str] = None,
+                     batch_size: int = 1000, force: bool = False) -> dict:
+        """
+        Переносит историю из файлов. Таблицу, в которой уже есть записи,
+        пропускает (повторный импорт задублировал бы всю историю), если не force.
+        """
+        imported = {"logs": 0, "test_results": 0, "skipped": []}
+        if logfile and not force and self.has_rows("logs"):
+            imported["skipped"].append("logs")
+            logfile = None
+        if test_results_file and not force and self.has_rows("test_results"):
+            imported["skipped"].append("test_results")
+            test_results_file = None
+        if logfile:  # LogQuery читает и сегменты, активного файла может не быть
+            batch = []
+            for record in LogQuery(logfile):
+                batch.append(_log_row(record))
+                if len(batch) >= batch_size:
+                    self.insert_many(INSERT_LOG, batch)
+                    imported["logs"] += len(batch)
+                    batch = []
+            if batch:
+                self.insert_many(INSERT_LOG, batch)
+                imported["logs"] += len(batch)
+        if test_results_file and os.path.exists(test_results_file):
+            rows = [_test_result_row(r) for r in TestResultsFile(test_results_file).records()]
+            self.insert_many(INSERT_TEST_RESULT, rows)
+            imported["test_results"] = len(rows)
+        return imported
+
+
+def make_storage(logfile: str, test_results_file: str):
+    backend = os.environ.get("STORAGE_BACKEND", "file")
+    if backend == "file":
+        return FileStorage(logfile, test_results_file)
+    if backend == "sqlite":
+        return SqliteStorage(os.environ.get("SQLITE_PATH", "lab.sqlite3"))
+    raise ValueError(f"unknown STORAGE_BACKEND: {backend!r}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Хранилище identserver")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="перенести logs.jsonl и test_results.json в SQLite")
+    imp.add_argument("--db", default=os.environ.get("SQLITE_PATH", "lab.sqlite3"))
+    imp.add_argument("--logs", default="logs.jsonl")
+    imp.add_argument("--results", default="test_results.json")
+    imp.add_argument("--force", action="store_true",
+                     help="импортировать и в непустые таблицы (записи задублируются)")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        imported = SqliteStorage(args.db).import_files(args.logs, args.results, force=args.force)
+        print(f"imported {imported['logs']} log records, "
+              f"{imported['test_results']} test results into {args.db}")
+        for table in imported["skipped"]:
+            print(f"skipped {table}: table is not empty (use --force to import anyway)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули лаборатории лежат уровнем выше tests/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
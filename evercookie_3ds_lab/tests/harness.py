@@ -0,0 +1,235 @@
+"""
+Параллельный прогон браузерных тестов: браузер × стенд × повтор.
+
+Каждый случай — два запуска браузера с одним профилем: первый заход
+выдаёт UID, второй показывает, восстановился ли он. Chrome идёт headless
+в отдельных процессах, у каждого случая свой каталог профиля. safaridriver
+держит одну сессию на машину, поэтому случаи Safari идут подряд в одном
+воркере. Результаты уходят на /save-test-result пачками.
+
+    python tests/harness.py --browsers chrome safari --stands cross proxy --repeat 3
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+
+import requests
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException, WebDriverException
+
+DOMAIN_URL = os.environ.get("DOMAIN_URL", "http://domain1.local:8000")
+IDENTSERVER_URL = os.environ.get("IDENTSERVER_URL", "http://identserver.local:8001")
+
+STANDS = {"cross": "/test-cross", "proxy": "/test-proxy"}
+BROWSER_NAMES = {"chrome": "Chrome", "safari": "Safari"}
+
+# Браузеры, которые нельзя запускать параллельно
+SINGLE_SESSION = {"safari"}
+
+# Сколько ждать, пока safaridriver освободит сессию после quit()
+SAFARI_SESSION_TIMEOUT = 30.0
+
+
+class Case(NamedTuple):
+    browser: str
+    stand: str
+    repetition: int
+
+
+# ---------- Браузеры ----------
+
+def start_chrome(profile_dir: str):
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument(f"--user-data-dir={profile_dir}")
+    options.add_argument("--no-first-run")
+    options.add_argument("--no-default-browser-check")
+    return webdriver.Chrome(options=options)
+
+
+def start_safari():
+    """
+    Вместо фиксированной паузы после quit() — повторяем создание сессии,
+    пока safaridriver не закроет предыдущую.
+    """
+    deadline = time.monotonic() + SAFARI_SESSION_TIMEOUT
+    while True:
+        try:
+            return webdriver.Safari()
+        except SessionNotCreatedException:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def start_browser(browser: str, profile_dir: str):
+    if browser == "chrome":
+        return start_chrome(profile_dir)
+    if browser == "safari":
+        # У Safari нет отдельных профилей: между запусками живёт системный
+        return start_safari()
+    raise ValueError(f"unknown browser: {browser}")
+
+
+# Ждёт window.__deviceIdReady со страницы стенда (см. device_id_script в app_domain1.py)
+WAIT_FOR_UID_JS = """
+var done = arguments[arguments.length - 1];
+if (!window.__deviceIdReady) {
+    done({error: "page has no __deviceIdReady"});
+    return;
+}
+window.__deviceIdReady.then(done);
+"""
+
+
+def wait_for_uid(driver, path: str, timeout: float = 15.0) -> dict:
+    """
+    Открывает страницу стенда и ждёт DEVICE_ID без опроса DOM.
+    Возвращает {id, mode, channels, ms}, где ms — от начала навигации до UID.
+    При таймауте — selenium TimeoutException.
+    """
+    driver.set_script_timeout(timeout)
+    driver.get(f"{DOMAIN_URL}{path}")
+    result = driver.execute_async_script(WAIT_FOR_UID_JS)
+    if result.get("error"):
+        raise WebDriverException(result["error"])
+    return result
+
+
+def visit(browser: str, profile_dir: str, path: str) -> dict:
+    driver = start_browser(browser, profile_dir)
+    try:
+        return wait_for_uid(driver, path)
+    finally:
+        driver.quit()
+
+
+# ---------- Случаи ----------
+
+def run_case(case: Case) -> dict:
+    """Два запуска браузера с одним профилем; ошибка не роняет весь прогон."""
+    record = {
+        "browser": BROWSER_NAMES[case.browser],
+        "stand": case.stand,
+        "repetition": case.repetition,
+        "uid1": None,
+        "uid2": None,
+        "uid1_ms": None,
+        "uid2_ms": None,
+    }
+    profile_dir = tempfile.mkdtemp(prefix=f"evercookie-{case.browser}-")
+    started = time.perf_counter()
+    try:
+        for n in (1, 2):
+            found = visit(case.browser, profile_dir, STANDS[case.stand])
+            record[f"uid{n}"] = found["id"]
+            record[f"uid{n}_ms"] = found["ms"]
+    except WebDriverException as e:
+        record["error"] = f"{type(e).__name__}: {e.msg}"
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+    record["duration_s"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def run_serial(cases: list) -> list:
+    return [run_case(case) for case in cases]
+
+
+def save_results(records: list) -> None:
+    """Пачка результатов одним запросом."""
+    if records:
+        requests.post(f"{IDENTSERVER_URL}/save-test-result", json=records, timeout=10)
+
+
+def run_matrix(browsers, stands, repeat: int = 1, workers: int = None,
+               save: bool = True, batch_size: int = 20) -> list:
+    cases = [
+        Case(browser, stand, n)
+        for n in range(repeat)
+        for browser in browsers
+        for stand in stands
+    ]
+    parallel = [c for c in cases if c.browser not in SINGLE_SESSION]
+    serial = [c for c in cases if c.browser in SINGLE_SESSION]
+    workers = workers or min(len(parallel) + bool(serial), os.cpu_count() or 1) or 1
+
+    results, batch = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_case, case) for case in parallel]
+        if serial:
+            futures.append(pool.submit(run_serial, serial))
+        for future in as_completed(futures):
+            done = future.result()
+            done = done if isinstance(done, list) else [done]
+            results.extend(done)
+            batch.extend(done)
+            if save and len(batch) >= batch_size:
+                save_results(batch)
+                batch = []
+    if save:
+        save_results(batch)
+
+    results.sort(key=lambda r: (r["browser"], r["stand"], r["repetition"]))
+    return results
+
+
+def latency_summary(results: list) -> dict:
+    """
+    Навигация -> UID по браузеру и стенду, отдельно для первого
+    (UID выдаётся) и второго (UID восстанавливается) запуска: медиана и максимум, мс.
+    """
+    summary = {}
+    for n in (1, 2):
+        by_key = {}
+        for r in results:
+            if r.get(f"uid{n}_ms") is not None:
+                by_key.setdefault((r["browser"], r["stand"]), []).append(r[f"uid{n}_ms"])
+        for key, values in by_key.items():
+            values.sort()
+            summary.setdefault(key, {})[f"launch{n}"] = {
+                "n": len(values),
+                "median_ms": values[len(values) // 2],
+                "max_ms": values[-1],
+            }
+    return summary
+
+
+def print_results(results: list) -> None:
+    for r in results:
+        status = r.get("error") or ("same" if r["uid1"] and r["uid1"] == r["uid2"] else "new")
+        print(f"{r['browser']} {r['stand'].upper()} #{r['repetition']}: "
+              f"{r['uid1']} => {r['uid2']}  ({status}, "
+              f"{r['uid1_ms']} / {r['uid2_ms']} ms до UID, {r['duration_s']} s)")
+
+    summary = latency_summary(results)
+    if summary:
+        print("\nнавигация -> UID, мс (медиана / максимум):")
+    for (browser, stand), launches in sorted(summary.items()):
+        cells = "  ".join(
+            f"{name}: {v['median_ms']} / {v['max_ms']} (n={v['n']})"
+            for name, v in sorted(launches.items()))
+        print(f"  {browser} {stand.upper():6} {cells}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Параллельный прогон браузерных тестов")
+    parser.add_argument("--browsers", nargs="+", choices=sorted(BROWSER_NAMES), default=["chrome"])
+    parser.add_argument("--stands", nargs="+", choices=sorted(STANDS), default=sorted(STANDS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workers", type=int, help="процессов (по умолчанию по числу случаев и CPU)")
+    parser.add_argument("--no-save", action="store_true", help="не отправлять на /save-test-result")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = run_matrix(args.browsers, args.stands, args.repeat, args.workers, save=not args.no_save)
+    print_results(results)
+    print(f"\n{len(results)} случаев за {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
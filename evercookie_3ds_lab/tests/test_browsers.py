@@ -1,86 +1,20 @@
-import time
-import requests
-from selenium import webdriver
-from selenium.webdriver.common.by import By
+import os
 
-DOMAIN_URL = "http://domain1.local:8000"
-IDENTSERVER_URL = "http://identserver.local:8001"
+from harness import print_results, run_matrix
 
+# Сколько раз повторить каждый стенд (случаи идут параллельно, см. harness.py)
+REPEAT = int(os.environ.get("BROWSER_TEST_REPEAT", "1"))
 
-def save_test_result(browser: str, stand: str, uid1: str, uid2: str) -> None:
-    """
-    Отправляет результат теста на identserver, чтобы потом
-    показывать красивую таблицу и график.
-    """
-    requests.post(f"{IDENTSERVER_URL}/save-test-result", json={
-        "browser": browser,
-        "stand": stand,
-        "uid1": uid1,
-        "uid2": uid2,
-    })
 
-
-def wait_for_uid(driver, path: str, timeout: float = 15.0) -> str:
-    """
-    Открывает страницу стенда и ждёт, пока UID перестанет быть 'жду…'.
-    """
-    driver.get(f"{DOMAIN_URL}{path}")
-    deadline = time.time() + timeout
-    last = ""
-    while time.time() < deadline:
-        span = driver.find_element(By.ID, "uid-value")
-        text = span.text.strip()
-        last = text
-        if text and text != "жду…":
-            return text
-        time.sleep(0.3)
-    return last
+def check(results: list) -> None:
+    print_results(results)
+    errors = [r for r in results if r.get("error")]
+    assert not errors, errors
 
 
 def test_safari_cross_and_proxy():
-    driver = webdriver.Safari()
-    try:
-        uid1_cross = wait_for_uid(driver, "/test-cross")
-        uid1_proxy = wait_for_uid(driver, "/test-proxy")
-
-        driver.quit()
-        time.sleep(2)
-
-        driver = webdriver.Safari()
-
-        uid2_cross = wait_for_uid(driver, "/test-cross")
-        uid2_proxy = wait_for_uid(driver, "/test-proxy")
-
-        print("Safari CROSS:", uid1_cross, "=>", uid2_cross)
-        print("Safari PROXY:", uid1_proxy, "=>", uid2_proxy)
-
-        save_test_result("Safari", "cross", uid1_cross, uid2_cross)
-        save_test_result("Safari", "proxy", uid1_proxy, uid2_proxy)
-
-    finally:
-        driver.quit()
+    check(run_matrix(["safari"], ["cross", "proxy"], repeat=REPEAT))
 
 
 def test_chrome_cross_and_proxy():
-    options = webdriver.ChromeOptions()
-    driver = webdriver.Chrome(options=options)
-    try:
-        uid1_cross = wait_for_uid(driver, "/test-cross")
-        uid1_proxy = wait_for_uid(driver, "/test-proxy")
-
-        driver.quit()
-        time.sleep(2)
-
-        driver = webdriver.Chrome(options=options)
-
-        uid2_cross = wait_for_uid(driver, "/test-cross")
-        uid2_proxy = wait_for_uid(driver, "/test-proxy")
-
-        print("Chrome CROSS:", uid1_cross, "=>", uid2_cross)
-        print("Chrome PROXY:", uid1_proxy, "=>", uid2_proxy)
-
-        save_test_result("Chrome", "cross", uid1_cross, uid2_cross)
-        save_test_result("Chrome", "proxy", uid1_proxy, uid2_proxy)
-
-    finally:
-        driver.quit()
+    check(run_matrix(["chrome"], ["cross", "proxy"], repeat=REPEAT))
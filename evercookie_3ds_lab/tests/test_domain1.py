@@ -0,0 +1,71 @@
+"""
+domain1 без браузеров и без identserver: upstream подменён транспортом httpx.
+pytest tests/test_domain1.py
+"""
+import asyncio
+
+import httpx
+import pytest
+
+import app_domain1
+from static_pages import StaticPage
+from upstream import Upstream, UpstreamCache
+
+
+@pytest.fixture
+def identserver(monkeypatch):
+    """Ставит handler(request) вместо identserver; возвращает функцию-установщик."""
+    def install(handler):
+        upstream = Upstream("http://identserver", transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(app_domain1, "upstream", upstream)
+        monkeypatch.setattr(app_domain1, "upstream_cache", UpstreamCache(upstream))
+
+    return install
+
+
+def get(path: str, headers: dict = None, **params) -> httpx.Response:
+    async def main():
+        transport = httpx.ASGITransport(app=app_domain1.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://domain1") as client:
+            return await client.get(path, params=params, headers=headers)
+
+    return asyncio.run(main())
+
+
+def test_proxy_cache_upstream_exception_is_502(identserver):
+    def handler(request):
+        # Так падение identserver выглядит через ASGITransport: не httpx.HTTPError
+        raise RuntimeError("identserver crashed")
+
+    identserver(handler)
+    assert get("/proxy-cache.png").status_code == 502
+
+
+def test_stand_page_compressed_variants():
+    plain = get("/test-cross", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    # httpx сам разжимает тело, сравниваем уже разжатое
+    br = get("/test-cross", headers={"Accept-Encoding": "br, gzip"})
+    gz = get("/test-cross", headers={"Accept-Encoding": "gzip"})
+    assert br.headers["content-encoding"] == "br" and gz.headers["content-encoding"] == "gzip"
+    assert br.content == gz.content == plain.content
+    assert len({plain.headers["etag"], br.headers["etag"], gz.headers["etag"]}) == 3
+    again = get("/test-cross", headers={"Accept-Encoding": "br", "If-None-Match": br.headers["etag"]})
+    assert again.status_code == 304
+    # Все варианты собраны вместе со страницей, а не по первому запросу с кодировкой
+    assert set(StaticPage("<p>lab</p>")._bodies) == {None, "gzip", "br"}
+
+
+def test_results_page_skips_malformed_rows(identserver):
+    rows = [
+        {"browser": "chrome", "stand": "cross", "uid1": "a", "uid2": "a", "uid1_ms": 120.4, "uid2_ms": 98},
+        "not a row",
+        None,
+        {"browser": "<b>safari</b>", "stand": "proxy", "uid1_ms": "slow", "uid2_ms": True},
+    ]
+    identserver(lambda request: httpx.Response(200, json=rows))
+    resp = get("/test-results")
+    assert resp.status_code == 200
+    assert "120 / 98" in resp.text
+    assert "— / —" in resp.text
+    assert "&lt;b&gt;safari&lt;/b&gt;" in resp.text
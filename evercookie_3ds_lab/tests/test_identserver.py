@@ -0,0 +1,139 @@
+"""
+identserver без браузеров: /logs, /log, /logs/stream через httpx.
+pytest tests/test_identserver.py
+"""
+import asyncio
+import json
+import socket
+
+import httpx
+import pytest
+import uvicorn
+
+from log_schema import LOG_MAX_BODY
+
+
+@pytest.fixture
+def identserver(tmp_path, monkeypatch):
+    # logs.jsonl и test_results.json — относительные пути, пишутся в tmp_path
+    monkeypatch.chdir(tmp_path)
+    import app_identserver
+    return app_identserver
+
+
+def test_shutdown_with_open_stream(identserver, monkeypatch):
+    monkeypatch.setattr(identserver, "LOG_TAIL_STREAM_S", 0.5)
+    monkeypatch.setattr(identserver.log_sink, "flush_interval", 10.0)
+
+    async def main():
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        url = "http://127.0.0.1:%d" % sock.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(identserver.app, log_level="warning"))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            await asyncio.sleep(0.01)
+        async with httpx.AsyncClient(base_url=url) as client:
+            async with client.stream("GET", "/logs/stream") as stream:
+                assert stream.status_code == 200
+                # Запись ждёт в очереди LogSink (flush_interval большой) до остановки
+                resp = await client.post("/log", json={"uid": "shutdown-1", "mode": "cross"})
+                assert resp.status_code == 200
+                server.should_exit = True
+                await asyncio.wait_for(serving, 5)
+        sock.close()
+
+    asyncio.run(main())
+    assert not identserver.log_sink.running
+    with open("logs.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line)["uid"] for line in f] == ["shutdown-1"]
+
+
+def get(app, path: str, **params) -> httpx.Response:
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://identserver") as client:
+            return await client.get(path, params=params)
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("param", ["since", "until"])
+@pytest.mark.parametrize("path", ["/logs", "/logs/stream"])
+def test_bad_time_filter_is_rejected(identserver, path, param):
+    resp = get(identserver.app, path, **{param: "garbage"})
+    assert resp.status_code == 422
+    assert param in resp.json()["error"]
+
+
+def test_time_filter_applies(identserver):
+    with open("logs.jsonl", "w", encoding="utf-8") as f:
+        for day in (1, 2, 3):
+            f.write(json.dumps({"uid": f"u{day}", "timestamp": f"2025-01-0{day}T12:00:00Z"}) + "\n")
+    resp = get(identserver.app, "/logs", since="2025-01-02", until="2025-01-02T23:59:59Z")
+    assert resp.status_code == 200
+    assert [r["uid"] for r in resp.json()] == ["u2"]
+
+
+def post_log(app, body: bytes, chunked: bool = False) -> httpx.Response:
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://identserver") as client:
+            if chunked:
+                async def chunks():
+                    for i in range(0, len(body), 1000):
+                        yield body[i:i + 1000]
+
+                content = chunks()  # без Content-Length: предел проверяется по мере чтения
+            else:
+                content = body
+            return await client.post("/log", content=content,
+                                     headers={"Content-Type": "application/json"})
+
+    return asyncio.run(main())
+
+
+def log_body(**fields) -> bytes:
+    return json.dumps({"uid": "a" * 32, "mode": "cross", **fields}).encode()
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_log_body_limit(identserver, chunked):
+    body = log_body(userAgent="UA")
+    # Пробелы после JSON — всё ещё валидный JSON, добиваем ровно до предела
+    exact = body + b" " * (LOG_MAX_BODY - len(body))
+    assert post_log(identserver.app, exact, chunked).status_code == 200
+    assert post_log(identserver.app, exact + b" ", chunked).status_code == 413
+
+
+@pytest.mark.parametrize("fields, status", [
+    ({}, 200),
+    ({"uid": "u" * 64}, 200),
+    ({"uid": "u" * 65}, 422),
+    ({"uid": ""}, 422),
+    ({"channels": {"cookie": "c" * 64}}, 200),
+    ({"channels": {"cookie": "c" * 65}}, 422),
+    ({"channels": {"cookie": None, "pngCache": "x"}}, 200),
+    ({"channels": {"flash": "x"}}, 422),
+    ({"channels": {"cookie": 123}}, 422),
+    ({"channels": ["cookie"]}, 422),
+    ({"mode": "other"}, 422),
+    ({"uid": 123}, 422),
+    ({"userAgent": "u" * 512}, 200),
+    ({"userAgent": "u" * 513}, 422),
+    ({"timings": {"total": 600000}}, 200),
+    ({"timings": {"total": 600001}}, 422),
+    ({"timings": {"total": "fast"}}, 422),
+    ({"timings": {"read": {"cookie": -1}}}, 422),
+    ({"extra": 1}, 422),
+])
+def test_log_schema_boundaries(identserver, fields, status):
+    resp = post_log(identserver.app, log_body(**fields))
+    assert resp.status_code == status, resp.text
+    if status == 422:
+        assert resp.json()["status"] == "error"
+
+
+def test_log_rejects_broken_json(identserver):
+    assert post_log(identserver.app, b'{"uid": "a", "mode": ').status_code == 422
+    assert post_log(identserver.app, b"[]").status_code == 422
@@ -0,0 +1,59 @@
+"""
+Лог-коллектор и SocketLogWriter воркера (log_collector.py).
+pytest tests/test_log_collector.py
+"""
+import asyncio
+import json
+
+from log_collector import LogCollector, SocketLogWriter
+from log_sink import FileLogWriter, LogSink
+
+
+def read_uids(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["uid"] for line in f]
+
+
+def test_stop_drains_open_connections(tmp_path):
+    logfile = str(tmp_path / "logs.jsonl")
+    sock = str(tmp_path / "c.sock")
+    batch = [{"uid": f"u{i}"} for i in range(2000)]
+
+    async def main():
+        collector = LogCollector(LogSink(FileLogWriter(logfile)), sock)
+        await collector.start()
+        worker = SocketLogWriter(sock)
+        # send() вернулся — строки в буфере сокета, коллектор их ещё не прочитал
+        await asyncio.to_thread(worker.write_batch, batch)
+        while not collector._handlers:  # коллектор принял соединение
+            await asyncio.sleep(0.01)
+        stopping = asyncio.create_task(collector.stop())
+        await asyncio.sleep(0.2)
+        assert not stopping.done()  # ждёт, пока воркер закроет соединение
+        worker.close()
+        await asyncio.wait_for(stopping, 5)
+        return collector
+
+    collector = asyncio.run(main())
+    assert collector.abandoned == 0
+    assert read_uids(logfile) == [r["uid"] for r in batch]
+
+
+def test_stop_gives_up_after_drain_timeout(tmp_path):
+    logfile = str(tmp_path / "logs.jsonl")
+    sock = str(tmp_path / "c.sock")
+
+    async def main():
+        collector = LogCollector(LogSink(FileLogWriter(logfile)), sock, drain_timeout=0.2)
+        await collector.start()
+        worker = SocketLogWriter(sock)
+        await asyncio.to_thread(worker.write_batch, [{"uid": "u0"}])
+        while not collector._handlers:
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(collector.stop(), 5)
+        worker.close()
+        return collector
+
+    collector = asyncio.run(main())
+    assert collector.abandoned == 1
+    assert read_uids(logfile) == ["u0"]
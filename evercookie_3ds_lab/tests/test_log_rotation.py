@@ -0,0 +1,158 @@
+"""
+Ротация logs.jsonl и чтение через сегменты (log_rotation.py, SegmentedLog).
+Без браузеров: pytest tests/test_log_rotation.py
+"""
+import gzip
+import json
+import os
+
+from log_reader import LogFilter, LogQuery, load_manifest, segments_dir
+from log_rotation import RotatingLogWriter, recover, seal
+
+
+def record(i: int, day: int = 1) -> dict:
+    return {"uid": f"u{i}", "mode": "cross" if i % 2 else "proxy",
+            "timestamp": f"2025-01-{day:02d}T00:00:00Z"}
+
+
+def write_days(path: str, days: int = 6, per_day: int = 40, max_bytes: int = 4000) -> list:
+    writer = RotatingLogWriter(path, max_bytes=max_bytes)
+    written = []
+    for day in range(1, days + 1):
+        for start in range(0, per_day, 10):
+            batch = [record((day - 1) * per_day + start + i, day) for i in range(10)]
+            writer.write_batch(batch)
+            written += batch
+    writer.close()
+    return written
+
+
+def uids(records) -> list:
+    return [r["uid"] for r in records]
+
+
+def pages(path: str, order: str, limit: int) -> list:
+    out, cursor = [], None
+    while True:
+        if order == "asc":
+            query = LogQuery(path, cursor or 0, limit)
+        else:
+            query = LogQuery(path, limit=limit, order="desc", before=cursor)
+        out += list(query)
+        if not query.has_more:
+            return out
+        cursor = query.cursor
+
+
+def test_rotation_keeps_every_record_in_order(tmp_path):
+    path = str(tmp_path / "logs.jsonl")
+    written = write_days(path)
+    manifest = load_manifest(path)
+    assert len(manifest["segments"]) >= 3
+    assert all(s["name"].endswith(".gz") for s in manifest["segments"])
+    with open(path, "rb") as f:
+        active = sum(1 for _ in f)
+    assert sum(s["count"] for s in manifest["segments"]) + active == len(written)
+    assert uids(LogQuery(path)) == uids(written)
+
+
+def test_cursors_cross_segments(tmp_path):
+    path = str(tmp_path / "logs.jsonl")
+    written = write_days(path)
+    assert uids(pages(path, "asc", 7)) == uids(written)
+    assert uids(pages(path, "desc", 7)) == uids(reversed(written))
+
+
+def test_cursor_survives_rotation(tmp_path):
+    path = str(tmp_path / "logs.jsonl")
+    writer = RotatingLogWriter(path, max_bytes=10**9)
+    writer.write_batch([record(i) for i in range(5)])
+    first = LogQuery(path, limit=3)
+    assert uids(first) == ["u0", "u1", "u2"]
+    writer.close()
+    seal(path)
+    writer.write_batch([record(i) for i in range(5, 8)])
+    writer.close()
+    assert uids(LogQuery(path, first.cursor)) == ["u3", "u4", "u5", "u6", "u7"]
+
+
+def test_time_window_skips_segments(tmp_path, monkeypatch):
+    import log_reader
+
+    path = str(tmp_path / "logs.jsonl")
+    write_days(path)
+    opened = []
+    original = log_reader.open_segment
+    monkeypatch.setattr(log_reader, "open_segment",
+                        lambda p, s: opened.append(s["name"]) or original(p, s))
+    flt = LogFilter(since="2025-01-03T00:00:00Z", until="2025-01-03T23:59:59Z")
+    assert len(list(LogQuery(path, flt=flt))) == 40
+    segments = load_manifest(path)["segments"]
+    assert 0 < len(set(opened)) < len(segments)
+
+
+def test_recover_finishes_interrupted_rotation(tmp_path):
+    path = str(tmp_path / "logs.jsonl")
+    written = write_days(path, days=2)
+    directory = segments_dir(path)
+    manifest = load_manifest(path)
+
+    # Упали после переименования, до записи манифеста
+    with open(path, "a") as f:
+        for i in range(1000, 1005):
+            f.write(json.dumps(record(i)) + "\n")
+            written.append(record(i))
+    os.replace(path, os.path.join(directory, f"{manifest['next']:08d}.jsonl"))
+    # ...и после сжатия, до удаления несжатой копии
+    last = manifest["segments"][-1]["name"]
+    with gzip.open(os.path.join(directory, last)) as f:
+        with open(os.path.join(directory, last[:-3]), "wb") as out:
+            out.write(f.read())
+    # ...и посреди сжатия
+    with open(os.path.join(directory, "99999999.jsonl.gz.tmp"), "wb") as f:
+        f.write(b"partial")
+
+    recover(path)
+    assert sorted(os.listdir(directory)) == sorted(
+        ["manifest.json"] + [s["name"] for s in load_manifest(path)["segments"]])
+    assert uids(LogQuery(path)) == uids(written)
+
+
+def test_two_writers_lose_nothing(tmp_path):
+    """Воркеры без коллектора: один запечатывает файл, другой не должен писать в сегмент."""
+    path = str(tmp_path / "logs.jsonl")
+    a = RotatingLogWriter(path, max_bytes=500)
+    b = RotatingLogWriter(path, max_bytes=10**9)
+    expected = []
+    for i in range(60):
+        for writer, prefix in ((a, "a"), (b, "b")):
+            batch = [{"uid": f"{prefix}{i}", "mode": "cross"}]
+            writer.write_batch(batch)
+            expected += batch
+    a.close()
+    b.close()
+    assert len(load_manifest(path)["segments"]) >= 2
+    assert uids(LogQuery(path)) == uids(expected)
+
+
+def test_reverse_page_reads_one_block(tmp_path, monkeypatch):
+    import log_reader
+    import log_rotation
+
+    monkeypatch.setattr(log_rotation, "LOG_SEGMENT_BLOCK_KB", 1)
+    path = str(tmp_path / "logs.jsonl")
+    written = write_days(path)
+    seal(path)
+    assert all(len(s["blocks"]) > 1 for s in load_manifest(path)["segments"])
+    assert uids(pages(path, "asc", 7)) == uids(written)
+    assert uids(pages(path, "desc", 7)) == uids(reversed(written))
+
+    decompressed = []
+    original = log_reader.gzip.decompress
+    monkeypatch.setattr(log_reader.gzip, "decompress",
+                        lambda data: decompressed.append(len(data)) or original(data))
+    query = LogQuery(path, limit=3, order="desc")
+    assert uids(query) == uids(reversed(written[-3:]))
+    assert uids(LogQuery(path, limit=3, order="desc", before=query.cursor)) == \
+        uids(reversed(written[-6:-3]))
+    assert len(decompressed) <= 2
@@ -0,0 +1,141 @@
+"""
+Group-commit запись логов (LogSink в log_sink.py) на подменном writer.
+pytest tests/test_log_sink.py
+"""
+import asyncio
+
+import pytest
+
+from log_sink import FileLogWriter, LogSink
+
+
+class FakeWriter:
+    def __init__(self, fail: int = 0):
+        self.batches = []
+        self.syncs = 0
+        self.closes = 0
+        self.fail = fail  # сколько следующих пачек уронить
+
+    def write_batch(self, batch: list) -> int:
+        if self.fail:
+            self.fail -= 1
+            raise OSError("disk full")
+        self.batches.append(list(batch))
+        return len(batch)
+
+    def sync(self) -> None:
+        self.syncs += 1
+
+    def close(self) -> None:
+        self.closes += 1
+
+    @property
+    def records(self) -> list:
+        return [r for batch in self.batches for r in batch]
+
+
+def test_stop_flushes_queued_tail():
+    writer = FakeWriter()
+    sink = LogSink(writer, batch_size=1000, flush_interval=60)
+
+    async def main():
+        await sink.start()
+        for i in range(25):
+            await sink.put({"n": i})
+        await sink.stop()
+
+    asyncio.run(main())
+    assert writer.records == [{"n": i} for i in range(25)]
+    assert sink.records_written == 25
+    assert writer.closes == 1
+
+
+def test_batches_by_size():
+    writer = FakeWriter()
+    sink = LogSink(writer, batch_size=10, flush_interval=60)
+
+    async def main():
+        await sink.start()
+        for i in range(25):
+            await sink.put({"n": i})
+        await sink.stop()
+
+    asyncio.run(main())
+    assert [len(b) for b in writer.batches] == [10, 10, 5]
+
+
+@pytest.mark.parametrize("policy, interval, syncs", [
+    ("none", 1.0, 0),
+    ("batch", 1.0, 5 + 1),      # после каждой пачки и на закрытии
+    ("interval", 3600, 1 + 1),  # первая пачка и закрытие, дальше интервал не прошёл
+])
+def test_fsync_policies(policy, interval, syncs):
+    writer = FakeWriter()
+    sink = LogSink(writer, fsync=policy, fsync_interval=interval)
+
+    async def main():
+        # Воркер не запущен — каждая put пишется сразу своей пачкой
+        for i in range(5):
+            await sink.put({"n": i})
+        await sink.start()
+        await sink.stop()
+
+    asyncio.run(main())
+    assert writer.syncs == syncs
+
+
+def test_unknown_fsync_policy():
+    with pytest.raises(ValueError):
+        LogSink(FakeWriter(), fsync="sometimes")
+
+
+def test_put_nowait_drops_when_full():
+    writer = FakeWriter()
+    sink = LogSink(writer, queue_size=3, flush_interval=60)
+
+    async def main():
+        await sink.start()
+        # Без await воркер не успевает разобрать очередь
+        for i in range(5):
+            sink.put_nowait({"n": i})
+        assert sink.dropped == 2
+        await sink.stop()
+
+    asyncio.run(main())
+    assert writer.records == [{"n": i} for i in range(3)]
+
+
+def test_failed_batch_is_counted_and_writer_reopened():
+    writer = FakeWriter(fail=1)
+    sink = LogSink(writer, batch_size=2, flush_interval=60)
+    written = []
+    sink.on_written = written.extend
+
+    async def main():
+        await sink.start()
+        for i in range(4):
+            await sink.put({"n": i})
+        await sink.stop()
+
+    asyncio.run(main())
+    assert sink.errors == 1 and sink.lost == 2
+    assert sink.last_error == "OSError: disk full"
+    assert writer.records == [{"n": 2}, {"n": 3}]
+    # Потерянное не попадает ни в счётчик записанного, ни в on_written
+    assert sink.records_written == 2 and written == [{"n": 2}, {"n": 3}]
+    assert writer.closes == 2  # после ошибки и на остановке
+    assert sink.stats()["lost"] == 2
+
+
+def test_file_writer_reopens_after_failed_close(tmp_path):
+    class BrokenFile:
+        def close(self):
+            raise OSError("EIO")
+
+    writer = FileLogWriter(str(tmp_path / "logs.jsonl"))
+    writer._file = BrokenFile()
+    with pytest.raises(OSError):
+        writer.close()
+    writer.write_batch([{"n": 1}])
+    writer.close()
+    assert (tmp_path / "logs.jsonl").read_text() == '{"n":1}\n'
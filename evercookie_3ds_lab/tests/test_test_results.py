@@ -0,0 +1,102 @@
+"""
+Файловое хранилище результатов автотестов (TestResultsFile в storage.py):
+журнал, компакция, восстановление после падения, несколько процессов.
+pytest tests/test_test_results.py
+"""
+import json
+import multiprocessing
+import os
+
+from storage import TestResultsFile
+
+
+def result(i: int, worker: int = 0) -> dict:
+    return {"id": f"w{worker}-{i}", "browser": "chrome", "stand": "cross"}
+
+
+def ids(records: list) -> list:
+    return [r["id"] for r in records]
+
+
+def test_journal_then_compaction(tmp_path):
+    path = str(tmp_path / "test_results.json")
+    store = TestResultsFile(path, compact_every=5)
+    for i in range(12):
+        store.append(result(i))
+    assert ids(store.records()) == [f"w0-{i}" for i in range(12)]
+    # Две компакции по 5 записей, в журнале остались 2
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)) == 10
+    assert ids(TestResultsFile(path).records()) == [f"w0-{i}" for i in range(12)]
+
+
+def test_torn_journal_tail(tmp_path):
+    path = str(tmp_path / "test_results.json")
+    store = TestResultsFile(path, compact_every=0)
+    store.append_many([result(0), result(1)])
+    # Процесс упал посреди записи: строка без \n
+    with open(path + ".journal", "ab") as f:
+        f.write(b'{"id": "torn", "brow')
+    assert ids(TestResultsFile(path).records()) == ["w0-0", "w0-1"]
+
+    other = TestResultsFile(path, compact_every=0)
+    other.append(result(2))
+    assert ids(other.records()) == ["w0-0", "w0-1", "w0-2"]
+    assert ids(store.records()) == ["w0-0", "w0-1", "w0-2"]
+
+
+def test_crash_before_snapshot_written(tmp_path):
+    path = str(tmp_path / "test_results.json")
+    store = TestResultsFile(path, compact_every=0)
+    store.append_many([result(i) for i in range(3)])
+    store.compact()
+    store.append_many([result(i) for i in range(3, 5)])
+    # Журнал уже переименован, снапшот ещё старый
+    os.replace(path + ".journal", path + ".journal.compacting")
+
+    fresh = TestResultsFile(path, compact_every=0)
+    assert ids(fresh.records()) == [f"w0-{i}" for i in range(5)]
+    assert not os.path.exists(path + ".journal.compacting")
+    fresh.append(result(5))
+    assert ids(TestResultsFile(path).records()) == [f"w0-{i}" for i in range(6)]
+
+
+def test_crash_after_snapshot_written(tmp_path):
+    path = str(tmp_path / "test_results.json")
+    store = TestResultsFile(path, compact_every=0)
+    store.append_many([result(i) for i in range(3)])
+    with open(path + ".journal", "rb") as f:
+        journal = f.read()
+    store.compact()
+    # Снапшот уже записан, а .compacting не успели удалить — второй раз не применяем
+    with open(path + ".journal.compacting", "wb") as f:
+        f.write(journal)
+
+    fresh = TestResultsFile(path, compact_every=0)
+    fresh.append(result(3))
+    assert ids(fresh.records()) == [f"w0-{i}" for i in range(4)]
+    assert not os.path.exists(path + ".journal.compacting")
+
+
+def _append_worker(path: str, worker: int, count: int) -> None:
+    store = TestResultsFile(path, compact_every=7)
+    for i in range(0, count, 3):
+        store.append_many([result(j, worker) for j in range(i, min(i + 3, count))])
+
+
+def test_processes_append_without_loss_or_duplicates(tmp_path):
+    path = str(tmp_path / "test_results.json")
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_append_worker, args=(path, w, 60)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(30)
+        assert p.exitcode == 0
+
+    records = ids(TestResultsFile(path).records())
+    assert sorted(records) == sorted(f"w{w}-{i}" for w in range(4) for i in range(60))
+    # Порядок внутри одного процесса сохраняется
+    for w in range(4):
+        mine = [r for r in records if r.startswith(f"w{w}-")]
+        assert mine == [f"w{w}-{i}" for i in range(60)]
@@ -0,0 +1,141 @@
+"""
+Circuit breaker и кэш чтений identserver (upstream.py) на подменном транспорте.
+pytest tests/test_upstream.py
+"""
+import asyncio
+import time
+
+import httpx
+
+from upstream import CircuitBreaker, Upstream, UpstreamCache
+
+
+class FakeIdentserver:
+    """Транспорт httpx: отвечает по self.mode и считает запросы."""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.mode == "raise":
+            # Так выглядит падение identserver через ASGITransport
+            raise RuntimeError("identserver crashed")
+        if self.mode == "timeout":
+            raise httpx.ReadTimeout("slow", request=request)
+        if self.mode == "500":
+            return httpx.Response(500)
+        if self.mode == "404":
+            return httpx.Response(404)
+        return httpx.Response(200, json=[{"n": self.calls}], headers={"X-Has-More": "0"})
+
+
+def make_cache(failures: int = 2, reset_after: float = 0.1) -> tuple:
+    fake = FakeIdentserver()
+    upstream = Upstream("http://identserver", transport=httpx.MockTransport(fake))
+    # ttl=0: каждый get_json идёт к identserver, старое отдаётся только при ошибке
+    cache = UpstreamCache(upstream, ttl=0, stale_ttl=0,
+                          breaker=CircuitBreaker(failures=failures, reset_after=reset_after))
+    return fake, cache
+
+
+def test_breaker_transitions():
+    breaker = CircuitBreaker(failures=3, reset_after=0.05)
+    for _ in range(2):
+        breaker.failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # пробный запрос один
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "closed"  # счёт ошибок начался заново
+
+
+def test_any_exception_counts_as_failure():
+    async def main():
+        fake, cache = make_cache(failures=2)
+        fake.mode = "raise"
+        for _ in range(2):
+            assert (await cache.get_json("/logs")).state == "missing"
+        assert cache.breaker.state == "open"
+        # Разомкнут — identserver больше не трогаем
+        assert (await cache.get_json("/logs")).state == "missing"
+        assert fake.calls == 2
+
+    asyncio.run(main())
+
+
+def test_5xx_and_timeouts_open_but_4xx_does_not():
+    async def main():
+        fake, cache = make_cache(failures=2)
+        fake.mode = "404"
+        for _ in range(3):
+            await cache.get_json("/logs")
+        assert cache.breaker.state == "closed"
+        fake.mode = "500"
+        await cache.get_json("/logs")
+        fake.mode = "timeout"
+        await cache.get_json("/logs")
+        assert cache.breaker.state == "open"
+
+    asyncio.run(main())
+
+
+def test_stale_while_open_then_recovers():
+    async def main():
+        fake, cache = make_cache(failures=2, reset_after=0.1)
+        first = await cache.get_json("/logs", {"limit": 5})
+        assert first.state == "fresh" and first.data == [{"n": 1}]
+        assert first.headers == {"X-Has-More": "0"}
+
+        fake.mode = "raise"
+        for _ in range(2):
+            result = await cache.get_json("/logs", {"limit": 5})
+            assert result.state == "stale" and result.data == [{"n": 1}]
+        assert cache.breaker.state == "open"
+        calls = fake.calls
+        result = await cache.get_json("/logs", {"limit": 5})
+        assert result.state == "stale" and result.data == [{"n": 1}]
+        assert fake.calls == calls
+
+        # Через reset_after пробный запрос проходит и замыкает breaker
+        fake.mode = "ok"
+        await asyncio.sleep(0.12)
+        result = await cache.get_json("/logs", {"limit": 5})
+        assert result.state == "fresh" and result.data == [{"n": fake.calls}]
+        assert cache.breaker.state == "closed"
+        await cache.upstream.aclose()
+
+    asyncio.run(main())
+
+
+def test_cancelled_probe_does_not_stick_half_open():
+    async def main():
+        fake, cache = make_cache(failures=1, reset_after=0)
+        fake.mode = "raise"
+        await cache.get_json("/logs")
+        assert cache.breaker.state == "open"
+
+        async def hang(request):
+            await asyncio.sleep(10)
+
+        cache.upstream = Upstream("http://identserver", transport=httpx.MockTransport(hang))
+        probe = asyncio.create_task(cache._fetch(("k",), "/logs", None, ""))
+        await asyncio.sleep(0.01)
+        assert cache.breaker.state == "half_open"
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        assert cache.breaker.state == "open"
+
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+import math
+import threading
+
+from log_reader import browser_family
+
+# Границы корзин гистограммы: геометрическая сетка от 0.01 мс до ~10 мин
+# с шагом 5% — погрешность перцентиля не больше 5%.
+BUCKET_MIN_MS = 0.01
+BUCKET_GROWTH = 1.05
+BUCKET_COUNT = 400
+MAX_TIMING_MS = 600_000
+
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+PERCENTILES = (50, 95, 99)
+
+# Ключи из клиента принимаем только известные — чтобы число гистограмм было ограничено
+CHANNELS = ("cookie", "localStorage", "sessionStorage", "indexedDB", "pngCache")
+MODES = ("cross", "proxy")
+
+
+def _bucket(value: float) -> int:
+    if value <= BUCKET_MIN_MS:
+        return 0
+    index = int(math.log(value / BUCKET_MIN_MS) / _LOG_GROWTH) + 1
+    return min(index, BUCKET_COUNT - 1)
+
+
+def _bucket_upper(index: int) -> float:
+    return BUCKET_MIN_MS * BUCKET_GROWTH ** index
+
+
+class StreamingHistogram:
+    """
+    Потоковая гистограмма с логарифмическими корзинами: O(1) на значение,
+    фиксированная память, перцентили без хранения исходных данных.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.counts[_bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                # верхняя граница корзины, но не больше реального максимума
+                return min(_bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        out = {"count": self.count}
+        for p in PERCENTILES:
+            out[f"p{p}"] = round(self.percentile(p), 2)
+        out["min"] = round(self.min, 2) if self.count else 0.0
+        out["max"] = round(self.max, 2)
+        out["avg"] = round(self.total / self.count, 2) if self.count else 0.0
+        return out
+
+
+def _valid_ms(value) -> bool:
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and 0 <= value <= MAX_TIMING_MS
+    )
+
+
+class TimingStats:
+    """
+    Перцентили клиентских таймингов из /log по ключу
+    (метрика, mode, семейство браузера). Метрики: read.<канал>,
+    write.<канал>, resolve (до postMessage) и total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, record) -> None:
+        if not isinstance(record, dict):
+            return
+        timings = record.get("timings")
+        if not isinstance(timings, dict):
+            return
+        mode = record.get("mode") if record.get("mode") in MODES else "unknown"
+        browser = browser_family(record.get("userAgent"))
+
+        values = []
+        for phase in ("read", "write"):
+            group = timings.get(phase)
+            if isinstance(group, dict):
+                for channel in CHANNELS:
+                    if _valid_ms(group.get(channel)):
+                        values.append((f"{phase}.{channel}", group[channel]))
+        for metric in ("resolve", "total"):
+            if _valid_ms(timings.get(metric)):
+                values.append((metric, timings[metric]))
+
+        with self._lock:
+            for metric, ms in values:
+                key = (metric, mode, browser)
+                hist = self._histograms.get(key)
+                if hist is None:
+                    hist = self._histograms[key] = StreamingHistogram()
+                hist.add(float(ms))
+
+    def snapshot(self) -> list:
+        with self._lock:
+            items = sorted(self._histograms.items())
+            return [
+                {"metric": metric, "mode": mode, "browser": browser, **hist.summary()}
+                for (metric, mode, browser), hist in items
+            ]
@@ -0,0 +1,292 @@
+"""
+Трассировка запросов domain1 -> identserver по W3C traceparent.
+
+Включается TRACING_ENABLED=1. Каждое приложение пишет спаны
+(handler, upstream-вызов, кодирование PNG, запись лога) в TRACE_FILE
+(по умолчанию spans.jsonl). Разбор трассы:
+
+    python tracing.py list
+    python tracing.py --file spans.jsonl --file ../other/spans.jsonl show <trace_id>
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+from contextvars import ContextVar
+
+from log_sink import FileLogWriter, LogSink
+
+TRACEPARENT_RE = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+# (trace_id, span_id) текущего спана в этом контексте (запрос, задача)
+_current = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(header: str):
+    """(trace_id, parent_span_id) из заголовка traceparent или None."""
+    m = TRACEPARENT_RE.fullmatch(header.strip().lower()) if header else None
+    if m is None or m.group(1) == "0" * 32 or m.group(2) == "0" * 16:
+        return None
+    return m.group(1), m.group(2)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "trace_id", "span_id", "parent_id",
+                 "start", "_started", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: dict, parent=None):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        if parent is None:
+            parent = _current.get()
+        if parent is None:
+            self.trace_id, self.parent_id = _new_id(128), None
+        else:
+            self.trace_id, self.parent_id = parent
+        self.span_id = _new_id(64)
+
+    def __enter__(self) -> "Span":
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current.set((self.trace_id, self.span_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self._started
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.tracer.service,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "attrs": self.attrs,
+        })
+
+
+class _NoopSpan:
+    @property
+    def attrs(self) -> dict:
+        # Каждый раз новый словарь: записи атрибутов в выключенный спан просто теряются
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """
+    Создаёт спаны и пишет их через LogSink в JSONL.
+    Выключенный трейсер (enabled=False) ничего не пишет и не пробрасывает.
+    """
+
+    def __init__(self, service: str, path: str = "spans.jsonl", enabled: bool = True):
+        self.service = service
+        self.enabled = enabled
+        self.sink = LogSink(FileLogWriter(path), fsync="none") if enabled else None
+
+    @classmethod
+    def from_env(cls, service: str) -> "Tracer":
+        return cls(
+            service,
+            path=os.environ.get("TRACE_FILE", "spans.jsonl"),
+            enabled=os.environ.get("TRACING_ENABLED") == "1",
+        )
+
+    def span(self, name: str, parent=None, **attrs):
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs, parent)
+
+    def inject(self) -> dict:
+        """Заголовок traceparent для исходящего запроса из текущего спана."""
+        current = _current.get() if self.enabled else None
+        if current is None:
+            return {}
+        trace_id, span_id = current
+        return {"traceparent": f"00-{trace_id}-{span_id}-01"}
+
+    def record(self, span: dict) -> None:
+        self.sink.put_nowait(span)
+
+    async def start(self) -> None:
+        if self.enabled:
+            await self.sink.start()
+
+    async def stop(self) -> None:
+        if self.enabled:
+            await self.sink.stop()
+
+
+class TracingMiddleware:
+    """
+    Корневой спан на каждый HTTP-запрос; продолжает трассу из входящего
+    traceparent. Имя спана — метод и шаблон маршрута, trace id уходит
+    клиенту в X-Trace-Id.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+
+        with self.tracer.span("handler", parent=parent) as span:
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    span.attrs["status"] = message["status"]
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-trace-id", span.trace_id.encode())
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_traced)
+            finally:
+                route = scope.get("route")
+                span.name = f"{scope['method']} {getattr(route, 'path', None) or scope['path']}"
+
+
+def install_tracing(app, service: str) -> Tracer:
+    """
+    Трейсер приложения по TRACING_ENABLED/TRACE_FILE. Выключенный
+    возвращается тоже: span() и inject() у него ничего не делают.
+    start()/stop() вызывает lifespan приложения.
+    """
+    tracer = Tracer.from_env(service)
+    if tracer.enabled:
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+    return tracer
+
+
+# ---------- CLI: разбор трасс ----------
+
+def load_spans(paths: list, trace_id: str = None) -> list:
+    spans = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if trace_id and trace_id not in line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                if trace_id is None or span.get("trace_id") == trace_id:
+                    spans.append(span)
+    return spans
+
+
+def _end(span: dict) -> float:
+    return span["start"] + span["duration_ms"] / 1000
+
+
+def critical_path(spans: list) -> list:
+    """
+    Цепочка от корня вниз: на каждом шаге — дочерний спан,
+    который закончился последним (он и держал родителя).
+    """
+    children = {}
+    ids = {s["span_id"] for s in spans}
+    roots = []
+    for span in spans:
+        if span.get("parent_id") in ids:
+            children.setdefault(span["parent_id"], []).append(span)
+        else:
+            roots.append(span)
+    if not roots:
+        return []
+    path = [max(roots, key=lambda s: s["duration_ms"])]
+    while children.get(path[-1]["span_id"]):
+        path.append(max(children[path[-1]["span_id"]], key=_end))
+    return path
+
+
+def _print_tree(spans: list) -> None:
+    by_parent = {}
+    ids = {s["span_id"] for s in spans}
+    for span in sorted(spans, key=lambda s: s["start"]):
+        parent = span.get("parent_id") if span.get("parent_id") in ids else None
+        by_parent.setdefault(parent, []).append(span)
+    t0 = min(s["start"] for s in spans)
+
+    def walk(parent, depth):
+        for span in by_parent.get(parent, []):
+            offset = (span["start"] - t0) * 1000
+            print(f"  {offset:9.3f} ms  {span['duration_ms']:9.3f} ms  "
+                  f"{'  ' * depth}{span['service']}: {span['name']}")
+            walk(span["span_id"], depth + 1)
+
+    walk(None, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Разбор трасс из spans.jsonl")
+    parser.add_argument("--file", action="append", help="файл спанов (можно несколько)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="дерево, критический путь и самые медленные спаны")
+    show.add_argument("trace_id")
+    show.add_argument("--top", type=int, default=5)
+    recent = sub.add_parser("list", help="последние трассы")
+    recent.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    paths = args.file or [os.environ.get("TRACE_FILE", "spans.jsonl")]
+
+    if args.command == "list":
+        traces = {}
+        for span in load_spans(paths):
+            if span.get("parent_id") is None:
+                traces[span["trace_id"]] = span
+        for span in sorted(traces.values(), key=lambda s: s["start"])[-args.limit:]:
+            print(f"{span['trace_id']}  {span['duration_ms']:9.3f} ms  "
+                  f"{span['service']}: {span['name']}")
+        return
+
+    spans = load_spans(paths, args.trace_id)
+    if not spans:
+        print(f"trace {args.trace_id} not found in {', '.join(paths)}")
+        return
+
+    print(f"trace {args.trace_id}: {len(spans)} spans\n")
+    _print_tree(spans)
+
+    print("\nкритический путь:")
+    for span in critical_path(spans):
+        print(f"  {span['duration_ms']:9.3f} ms  {span['service']}: {span['name']}")
+
+    print("\nсамые медленные спаны:")
+    for span in sorted(spans, key=lambda s: s["duration_ms"], reverse=True)[:args.top]:
+        print(f"  {span['duration_ms']:9.3f} ms  {span['service']}: {span['name']}")
+
+
+if __name__ == "__main__":
+    main()
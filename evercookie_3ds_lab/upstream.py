@@ -0,0 +1,250 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import httpx
+
+# Заголовки условного запроса: браузер -> identserver
+CONDITIONAL_REQUEST_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+# Заголовки кэширования: identserver -> браузер (в том числе у 304)
+CACHE_RESPONSE_HEADERS = ("ETag", "Cache-Control", "Expires", "Last-Modified")
+
+
+class Upstream:
+    """
+    Один общий async-клиент к identserver на всё приложение:
+    keep-alive, ограниченный пул соединений и таймауты.
+    Клиент создаётся при первом обращении и закрывается на shutdown.
+    С tracer каждый вызов — отдельный спан, traceparent уходит на identserver.
+    transport — по умолчанию настоящий HTTP, см. use_transport.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 5.0,
+        connect_timeout: float = 2.0,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        tracer=None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.base_url = base_url
+        self.tracer = tracer
+        self.transport = transport
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self.transport,
+            )
+        return self._client
+
+    def use_transport(self, transport: httpx.AsyncBaseTransport) -> None:
+        """
+        Подменяет транспорт до первого запроса: например, httpx.ASGITransport
+        с приложением identserver, когда оба живут в одном процессе (launcher.py).
+        """
+        if self._client is not None:
+            raise RuntimeError("upstream client is already created")
+        self.transport = transport
+
+    async def get(self, path: str, headers: dict = None, params: dict = None,
+                  timeout: float = None) -> httpx.Response:
+        timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+        if self.tracer is None:
+            return await self.client.get(path, headers=headers, params=params, timeout=timeout)
+        with self.tracer.span(f"upstream GET {path}") as span:
+            headers = {**(headers or {}), **self.tracer.inject()}
+            r = await self.client.get(path, headers=headers, params=params, timeout=timeout)
+            span.attrs["status"] = r.status_code
+            return r
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def conditional_headers(request_headers) -> dict:
+    """Выбирает из заголовков браузера те, что нужны для ревалидации."""
+    return {h: request_headers[h] for h in CONDITIONAL_REQUEST_HEADERS if h in request_headers}
+
+
+def copy_cache_headers(src, dst) -> None:
+    for h in CACHE_RESPONSE_HEADERS:
+        if h in src:
+            dst[h] = src[h]
+
+
+# ---------- Кэш чтений и circuit breaker ----------
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed — запросы идут; после failures ошибок подряд — open: запросы
+    сразу отклоняются. Через reset_after секунд — half_open: пропускаем
+    один пробный запрос, по его итогу снова closed или open.
+    """
+
+    def __init__(self, failures: int = 5, reset_after: float = 10.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._failed = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_after:
+            self.state = "half_open"
+            return True
+        # open или half_open, пока пробный запрос ещё в полёте
+        return False
+
+    def success(self) -> None:
+        self.state = "closed"
+        self._failed = 0
+
+    def failure(self) -> None:
+        self._failed += 1
+        if self.state == "half_open" or self._failed >= self.failures:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+class CachedResult(NamedTuple):
+    data: object
+    headers: dict
+    state: str  # fresh / stale / missing
+    age: float
+
+
+class UpstreamCache:
+    """
+    Кэш JSON-чтений с identserver (/logs, /test-results) для страниц domain1.
+
+    Моложе ttl — отдаём из кэша (fresh). От ttl до stale_ttl — отдаём
+    старое (stale) и обновляем в фоне. Иначе ждём запрос, но с коротким
+    таймаутом; не вышло — stale, если есть что отдать (записи живут,
+    пока их не вытеснит max_entries), или missing.
+    На один ключ в полёте не больше одного запроса, остальные его ждут.
+    Все запросы идут через circuit breaker: когда identserver лежит,
+    страница не ждёт таймаут, а сразу получает то, что есть.
+    """
+
+    def __init__(self, upstream: Upstream, ttl: float = 2.0, stale_ttl: float = 300.0,
+                 timeout: float = 1.0, breaker: CircuitBreaker = None,
+                 max_entries: int = 256, keep_headers=("X-Has-More", "X-Next-Cursor", "X-Tail-Seq"), record=None):
+        self.upstream = upstream
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.max_entries = max_entries
+        self.keep_headers = keep_headers
+        # record(caller, status, started) — учёт настоящих запросов (метрики domain1)
+        self.record = record
+        self._entries = OrderedDict()  # key -> (monotonic время получения, data, headers)
+        self._inflight = {}
+
+    @classmethod
+    def from_env(cls, upstream: Upstream, record=None) -> "UpstreamCache":
+        return cls(
+            upstream,
+            ttl=float(os.environ.get("UPSTREAM_CACHE_TTL", "2")),
+            stale_ttl=float(os.environ.get("UPSTREAM_STALE_TTL", "300")),
+            timeout=float(os.environ.get("UPSTREAM_READ_TIMEOUT", "1.0")),
+            breaker=CircuitBreaker(
+                failures=int(os.environ.get("UPSTREAM_BREAKER_FAILURES", "5")),
+                reset_after=float(os.environ.get("UPSTREAM_BREAKER_RESET", "10")),
+            ),
+            record=record,
+        )
+
+    async def get_json(self, path: str, params: dict = None, caller: str = "") -> CachedResult:
+        key = (path, tuple(sorted((params or {}).items())))
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return CachedResult(entry[1], entry[2], "fresh", age)
+            if age < self.stale_ttl:
+                self._refresh(key, path, params, caller)
+                return CachedResult(entry[1], entry[2], "stale", age)
+
+        try:
+            fetched_at, data, headers = await asyncio.shield(self._refresh(key, path, params, caller))
+        except UpstreamUnavailable:
+            if entry is not None:
+                # Старше stale_ttl, но лучше, чем ничего
+                return CachedResult(entry[1], entry[2], "stale", time.monotonic() - entry[0])
+            return CachedResult(None, {}, "missing", 0.0)
+        return CachedResult(data, headers, "fresh", time.monotonic() - fetched_at)
+
+    def _refresh(self, key, path: str, params: dict, caller: str) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, path, params, caller))
+            self._inflight[key] = task
+            # Ошибка фонового обновления уже учтена breaker-ом; забираем её, чтобы не было варнинга
+            task.add_done_callback(lambda t: (self._inflight.pop(key, None), t.cancelled() or t.exception()))
+        return task
+
+    async def _fetch(self, key, path: str, params: dict, caller: str) -> tuple:
+        if not self.breaker.allow():
+            raise UpstreamUnavailable("circuit open")
+        started = time.perf_counter()
+        try:
+            r = await self.upstream.get(path, params=params, timeout=self.timeout)
+            data = r.json() if r.status_code == 200 else None
+        except Exception as e:
+            # Не только httpx.HTTPError: через ASGITransport (launcher.py) исключение
+            # из identserver приходит сюда как есть
+            self._record(caller, "error", started)
+            self.breaker.failure()
+            raise UpstreamUnavailable(str(e)) from e
+        except BaseException:
+            # Отмена: иначе пробный запрос оставит breaker в half_open навсегда
+            self.breaker.failure()
+            raise
+        self._record(caller, r.status_code, started)
+
+        if r.status_code >= 500:
+            self.breaker.failure()
+            raise UpstreamUnavailable(f"identserver answered {r.status_code}")
+        # 4xx — ошибка запроса, а не identserver: не кэшируем, но и не размыкаем
+        self.breaker.success()
+        if r.status_code != 200:
+            raise UpstreamUnavailable(f"identserver answered {r.status_code}")
+
+        entry = (time.monotonic(), data, {h: r.headers[h] for h in self.keep_headers if h in r.headers})
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _record(self, caller: str, status, started: float) -> None:
+        if self.record is not None:
+            self.record(caller, status, started)